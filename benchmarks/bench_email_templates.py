@@ -0,0 +1,79 @@
+"""
+Compares build_html_email with compiled templates over 10k renders.
+
+Run from the repository root:
+    python benchmarks/bench_email_templates.py [--renders 10000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src import email_service
+
+QUESTION = {
+    "title": "Two Sum",
+    "difficulty": "Medium",
+    "link": "https://leetcode.com/problems/two-sum/",
+}
+QUOTE = "There is a difference between knowing the path and walking the path.\n- Morpheus (The Matrix)."
+HINTS = [
+    "Think about what you need to remember while scanning the array once.",
+    "A hash map from value to index answers 'have I seen the complement?' in O(1).",
+    "Check for the complement before inserting the current value.",
+]
+
+
+def bench_build(usernames):
+    start = time.perf_counter()
+    for i, username in enumerate(usernames):
+        email_service.build_html_email(username, solved=i % 2 == 0, quote=QUOTE, hints=HINTS, **QUESTION)
+    return time.perf_counter() - start
+
+
+def bench_compiled(usernames, minify):
+    start = time.perf_counter()
+    templates = {
+        solved: email_service.compile_html_email(solved=solved, quote=QUOTE, hints=HINTS, minify=minify, **QUESTION)
+        for solved in (True, False)
+    }
+    for i, username in enumerate(usernames):
+        templates[i % 2 == 0].render(username)
+    return time.perf_counter() - start
+
+
+def check_identical():
+    for solved in (True, False):
+        expected = email_service.build_html_email("alice", solved=solved, quote=QUOTE, hints=HINTS, **QUESTION)
+        template = email_service.compile_html_email(solved=solved, quote=QUOTE, hints=HINTS, minify=False, **QUESTION)
+        if template.render("alice") != expected:
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--renders", type=int, default=10_000)
+    args = parser.parse_args()
+
+    usernames = [f"user{i}" for i in range(args.renders)]
+    print(f"Byte-identical to build_html_email: {check_identical()}")
+
+    baseline = bench_build(usernames)
+    compiled = bench_compiled(usernames, minify=False)
+    minified = bench_compiled(usernames, minify=True)
+
+    full_size = len(email_service.build_html_email("alice", solved=False, quote=QUOTE, hints=HINTS, **QUESTION))
+    mini_size = len(email_service.compile_html_email(solved=False, quote=QUOTE, hints=HINTS, minify=True, **QUESTION).render("alice"))
+
+    print(f"{args.renders} renders")
+    print(f"  build_html_email       {baseline:8.3f}s")
+    print(f"  compiled               {compiled:8.3f}s  ({baseline / compiled:.1f}x)")
+    print(f"  compiled + minified    {minified:8.3f}s  ({baseline / minified:.1f}x)")
+    print(f"Reminder size: {full_size} bytes, minified {mini_size} bytes")
+
+
+if __name__ == "__main__":
+    main()
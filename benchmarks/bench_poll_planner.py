@@ -0,0 +1,153 @@
+"""
+Replays users' daily solve times through the fixed four-slot polling policy
+and the adaptive poll planner, offline, and compares them.
+
+Each check of a user that is not yet known to have solved costs one
+LeetCode request and, while they are still unsolved, sends a reminder.
+Whether a solve counts is decided with the same day window run_check uses
+for the question live at the check, so a check that misses an earlier solve
+of the same day shows up as a reminder sent after solving.
+The planner learns online, from the solves it has seen on earlier days,
+exactly like the bot.
+
+Solve histories are synthetic by default; pass --history with a .jsonl file
+of {"username": ..., "timestamps": [epoch, ...]} objects to replay real ones.
+
+Run from the repository root:
+    python benchmarks/bench_poll_planner.py [--users 1000] [--days 60] [--seed 1]
+    python benchmarks/bench_poll_planner.py --history solves.jsonl
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src import poll_planner
+from src import submission_sync
+
+# The original global slots, 03:30, 06:30, 13:30 and 17:30 UTC
+FIXED_CHECKS = [210, 390, 810, 1050]
+# Reminders this close to the rollover count as "last call" reminders
+LAST_CALL_MINUTES = 120
+# The first replayed day of synthetic histories
+FIRST_DAY = date(2026, 1, 1)
+
+
+def synthetic_histories(users, days, seed):
+    """Yields (username, [(UTC day, solve minute or None), ...]) for users with random habits."""
+    rng = random.Random(seed)
+    for i in range(users):
+        habit = rng.uniform(0, poll_planner.DAY_MINUTES)
+        spread = rng.uniform(20, 180)
+        solve_rate = rng.uniform(0.4, 0.95)
+        minutes = []
+        for n in range(days):
+            minute = int(rng.gauss(habit, spread)) if rng.random() < solve_rate else None
+            minutes.append((
+                FIRST_DAY + timedelta(days=n),
+                minute if minute is not None and 0 <= minute < poll_planner.DAY_MINUTES else None,
+            ))
+        yield f"user{i}", minutes
+
+def file_histories(path):
+    """Yields (username, [(UTC day, first solve minute or None), ...]) from a .jsonl history file."""
+    records = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                days = {}
+                for ts in sorted(int(t) for t in record["timestamps"]):
+                    day = datetime.fromtimestamp(ts, timezone.utc).date()
+                    days.setdefault(day, poll_planner.minute_of_day(ts))
+                records.append((record["username"], days))
+    all_days = sorted({day for _, days in records for day in days})
+    if not all_days:
+        return
+    first, last = all_days[0], all_days[-1]
+    span = [first.fromordinal(n) for n in range(first.toordinal(), last.toordinal() + 1)]
+    for username, days in records:
+        yield username, [(day, days.get(day)) for day in span]
+
+
+def replay_day(checks, day, solve_minute, stats):
+    """Runs one user-day through a list of check minutes of the UTC `day`."""
+    day_start = int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+    solved_at = day_start + solve_minute * 60 if solve_minute is not None else None
+    reminded = last_call = False
+    for check in checks:
+        checked_at = day_start + check * 60
+        stats["requests"] += 1
+        # The question live at the check is the one of its UTC date, judged by run_check's window
+        live = datetime.fromtimestamp(checked_at, timezone.utc).strftime("%Y-%m-%d")
+        start, end = submission_sync.question_day_window(live)
+        if solved_at is not None and start <= solved_at < end and solved_at <= checked_at:
+            break
+        stats["reminders"] += 1
+        stats["reminded_after_solve"] += solved_at is not None and solved_at <= checked_at
+        reminded = True
+        last_call = last_call or check >= poll_planner.CUTOFF_MINUTE - LAST_CALL_MINUTES
+    if solve_minute is None:
+        stats["unsolved_days"] += 1
+        stats["unsolved_reminded"] += reminded
+        stats["last_call"] += last_call
+    else:
+        stats["solved_days"] += 1
+        stats["reminded_before_solve"] += reminded
+
+def replay(histories):
+    fields = (
+        "requests", "reminders", "solved_days", "reminded_before_solve", "reminded_after_solve",
+        "unsolved_days", "unsolved_reminded", "last_call",
+    )
+    fixed = dict.fromkeys(fields, 0)
+    planned = dict.fromkeys(fields, 0)
+    user_days = 0
+    for _, days in histories:
+        seen = []
+        for day, solve_minute in days:
+            user_days += 1
+            replay_day(FIXED_CHECKS, day, solve_minute, fixed)
+            replay_day(poll_planner.plan_checks(seen[-poll_planner.MAX_SAMPLES:]) or FIXED_CHECKS, day, solve_minute, planned)
+            if solve_minute is not None:
+                seen.append(solve_minute)
+    return user_days, fixed, planned
+
+def report(user_days, fixed, planned):
+    def share(stats, part, whole):
+        return 100 * stats[part] / stats[whole] if stats[whole] else 0.0
+
+    print(f"{user_days} user-days replayed")
+    print(f"  {'':34}{'fixed slots':>14}{'planner':>14}")
+    rows = [
+        ("LeetCode requests per user-day", lambda s: s["requests"] / max(1, user_days), "{:14.2f}"),
+        ("reminders per user-day", lambda s: s["reminders"] / max(1, user_days), "{:14.2f}"),
+        ("unsolved days reminded (%)", lambda s: share(s, "unsolved_reminded", "unsolved_days"), "{:14.1f}"),
+        ("unsolved days, last-call rem. (%)", lambda s: share(s, "last_call", "unsolved_days"), "{:14.1f}"),
+        ("solved days reminded first (%)", lambda s: share(s, "reminded_before_solve", "solved_days"), "{:14.1f}"),
+        ("reminders sent after solving", lambda s: s["reminded_after_solve"], "{:14d}"),
+    ]
+    for label, value, fmt in rows:
+        print(f"  {label:<34}" + fmt.format(value(fixed)) + fmt.format(value(planned)))
+    saved = 100 * (1 - planned["requests"] / fixed["requests"]) if fixed["requests"] else 0.0
+    print(f"  requests saved by the planner: {saved:.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--history", help=".jsonl file of real solve timestamps per user")
+    args = parser.parse_args()
+
+    histories = file_histories(args.history) if args.history else synthetic_histories(args.users, args.days, args.seed)
+    report(*replay(histories))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Drives run_check end to end against local fake LeetCode, Gemini and SMTP
+servers for synthetic user sets, without any network access.
+
+Reports wall time, time spent per stage (summed over calls), requests
+issued to each fake and peak RSS. Every user count runs in a fresh
+subprocess with its own state database, so RSS and caches don't leak
+between sizes.
+
+Run from the repository root:
+    python benchmarks/bench_run_check.py [--users 100 1000 10000]
+        [--leetcode-latency 0.05] [--gemini-latency 0.5] [--smtp-latency 0.0]
+        [--leetcode-max-in-flight 6] [--smtp-accounts 1]
+        [--webhook-ratio 0.0] [--webhook-latency 0.0]
+"""
+import argparse
+import contextlib
+import functools
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+STAGES = [
+    ("daily_question", "leetcode_api", "get_daily_question"),
+    ("user_store", "user_store.UserStore", "refresh"),
+    ("fetch_submissions", "submission_sync", "sync_submissions"),
+    ("gemini", "gemini_service", "get_daily_content"),
+    ("compile_email", "email_service", "compile_html_email"),
+    ("render_email", "email_service.EmailTemplate", "render"),
+    ("send_email", "email_service.Mailer", "deliver"),
+]
+
+
+def _timed(fn, stage, timings, lock):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with lock:
+                total, calls = timings.get(stage, (0.0, 0))
+                timings[stage] = (total + elapsed, calls + 1)
+    return wrapper
+
+
+def instrument(timings):
+    """Wraps each stage's function with a timer (the modules look them up at call time)."""
+    import src
+    lock = threading.Lock()
+    for stage, target, name in STAGES:
+        module_name, _, class_name = target.partition(".")
+        __import__(f"src.{module_name}")
+        owner = getattr(src, module_name)
+        if class_name:
+            owner = getattr(owner, class_name)
+        setattr(owner, name, _timed(getattr(owner, name), stage, timings, lock))
+
+
+def run_child(args):
+    from fakes import FakeGemini, FakeLeetCode, FakeWebhook, SMTPSink
+
+    webhook = FakeWebhook(latency=args.webhook_latency).start()
+    workdir = tempfile.mkdtemp(prefix="bench-run-check-")
+    users_path = os.path.join(workdir, "users.jsonl")
+    with open(users_path, "w") as f:
+        for i in range(args.child):
+            user = {"username": f"user{i}", "email": f"user{i}@example.com"}
+            # Spread webhook-only users evenly through the file
+            if int((i + 1) * args.webhook_ratio) > int(i * args.webhook_ratio):
+                user["channels"] = [{"type": "webhook", "url": webhook.url}]
+            f.write(json.dumps(user) + "\n")
+
+    leetcode = FakeLeetCode(latency=args.leetcode_latency, solved_ratio=args.solved_ratio,
+                            max_in_flight=args.leetcode_max_in_flight).start()
+    gemini = FakeGemini(latency=args.gemini_latency).start()
+    sinks = [SMTPSink(latency=args.smtp_latency).start() for _ in range(max(1, args.smtp_accounts))]
+
+    from src import config, core_logic, http_transport, leetcode_api, outbox, pipeline
+    config.LEETCODE_API_URL = leetcode.url
+    config.GEMINI_API_URL = gemini.url
+    config.GEMINI_API_KEY = "bench"
+    config.SMTP_SERVER, config.SMTP_STARTTLS = "127.0.0.1", False
+    # One sender account per sink, each on its own port
+    config.SMTP_ACCOUNTS = json.dumps([
+        {"user": f"bot{i}@example.com", "password": "bench", "port": sink.port} for i, sink in enumerate(sinks)
+    ])
+    config.USERS_FILE = users_path
+    config.STATE_DB_PATH = os.path.join(workdir, "state.db")
+    config.SOLVE_HISTORY_DIR = os.path.join(workdir, "solve_history")
+    # Measure the bot itself, not the Gmail sending quotas
+    config.SMTP_SEND_PER_MINUTE = config.SMTP_SEND_PER_DAY = 0
+
+    timings = {}
+    instrument(timings)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        core_logic.run_check()
+        # Webhooks go out in the background; count them in the run
+        outbox.wait_for_channel_drains()
+        wall = time.perf_counter() - start
+
+    result = {
+        "users": args.child,
+        "wall_seconds": wall,
+        "stages": {stage: {"seconds": total, "calls": calls} for stage, (total, calls) in timings.items()},
+        "requests": {"leetcode": leetcode.requests, "leetcode_429": leetcode.throttled, "gemini": gemini.requests,
+                     "smtp_messages": sum(sink.messages for sink in sinks),
+                     "smtp_connections": sum(sink.connections for sink in sinks),
+                     "smtp_messages_per_account": [sink.messages for sink in sinks],
+                     "webhook": webhook.requests, "webhook_notifications": webhook.notifications},
+        "http": http_transport.latency_stats(),
+        "leetcode_concurrency_limit": leetcode_api.get_limiter().limit,
+        "queue_peaks": {stage: pipeline.QUEUE_PEAK.value(stage=stage) for stage in ("fetch", "decide", "render", "send")},
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    print(json.dumps(result))
+
+
+def print_report(result):
+    print(f"\n=== {result['users']} users ===")
+    print(f"  wall time          {result['wall_seconds']:9.3f}s")
+    print(f"  peak RSS           {result['peak_rss_mb']:9.1f} MB")
+    requests = result["requests"]
+    print(f"  requests           leetcode={requests['leetcode']} (429: {requests['leetcode_429']}) gemini={requests['gemini']} "
+          f"smtp messages={requests['smtp_messages']} smtp connections={requests['smtp_connections']}")
+    if requests["webhook"]:
+        print(f"  webhook            requests={requests['webhook']} notifications={requests['webhook_notifications']}")
+    if len(requests["smtp_messages_per_account"]) > 1:
+        print(f"  smtp per account   {requests['smtp_messages_per_account']}")
+    print(f"  leetcode limit     {result['leetcode_concurrency_limit']:9.1f} requests in flight at the end")
+    print("  queue peaks        " + " ".join(f"{stage}={peak}" for stage, peak in result["queue_peaks"].items()))
+    print("  stage                   seconds     calls")
+    for stage, _, _ in STAGES:
+        stats = result["stages"].get(stage)
+        if stats:
+            print(f"  {stage:<20} {stats['seconds']:10.3f} {stats['calls']:9d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--leetcode-latency", type=float, default=0.05, help="seconds per LeetCode request")
+    parser.add_argument("--gemini-latency", type=float, default=0.5, help="seconds per Gemini request")
+    parser.add_argument("--smtp-latency", type=float, default=0.0, help="seconds per accepted message")
+    parser.add_argument("--smtp-accounts", type=int, default=1, help="sender accounts, each with its own fake SMTP server")
+    parser.add_argument("--leetcode-max-in-flight", type=int, default=0, help="fake LeetCode answers 429 above this many requests at once (0: never)")
+    parser.add_argument("--webhook-ratio", type=float, default=0.0, help="share of users notified by webhook instead of email")
+    parser.add_argument("--webhook-latency", type=float, default=0.0, help="seconds per webhook request")
+    parser.add_argument("--solved-ratio", type=float, default=0.3, help="share of users who solved today's question")
+    parser.add_argument("--json", action="store_true", help="print raw JSON results")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        run_child(args)
+        return
+
+    for users in args.users:
+        command = [sys.executable, __file__, "--child", str(users),
+                   "--leetcode-latency", str(args.leetcode_latency), "--gemini-latency", str(args.gemini_latency),
+                   "--smtp-latency", str(args.smtp_latency), "--smtp-accounts", str(args.smtp_accounts),
+                   "--webhook-ratio", str(args.webhook_ratio), "--webhook-latency", str(args.webhook_latency),
+                   "--solved-ratio", str(args.solved_ratio),
+                   "--leetcode-max-in-flight", str(args.leetcode_max_in_flight)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print_report(result)
+
+
+if __name__ == "__main__":
+    main()
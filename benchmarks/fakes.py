@@ -0,0 +1,258 @@
+"""
+Local stand-ins for leetcode.com/graphql, the Gemini API, chat webhooks and an SMTP server,
+so the bot can be driven end to end without network access.
+"""
+import base64
+import hashlib
+import json
+import socketserver
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUESTION_SLUG = "two-sum"
+
+
+class _Server:
+    """Runs a socketserver on a free localhost port in a daemon thread."""
+
+    in_flight = 0
+
+    def start(self):
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        fake = self.server.fake
+        with fake.lock:
+            fake.requests += 1
+            fake.in_flight += 1
+        try:
+            if fake.latency:
+                time.sleep(fake.latency)
+            status, payload = fake.respond(body)
+        finally:
+            with fake.lock:
+                fake.in_flight -= 1
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeLeetCode(_Server):
+    """
+    Serves activeDailyCodingChallengeQuestion and (single or aliased batch)
+    recentAcSubmissionList. A deterministic `solved_ratio` of users have
+    solved today's question; everyone has some older submissions.
+    With `max_in_flight`, requests beyond that many at once get a 429.
+    """
+
+    def __init__(self, latency=0.0, solved_ratio=0.3, max_in_flight=None):
+        self.latency = latency
+        self.solved_ratio = solved_ratio
+        self.max_in_flight = max_in_flight
+        self.requests = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+        self.now = int(time.time())
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _JSONHandler)
+        self.server.fake = self
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/graphql"
+
+    def submissions(self, username, limit):
+        seed = int(hashlib.md5(username.encode("utf-8")).hexdigest()[:8], 16)
+        subs = [{"titleSlug": f"problem-{seed % 97}-{i}", "timestamp": str(self.now - 3600 * (i + 1) * 7)} for i in range(20)]
+        if seed % 1000 < self.solved_ratio * 1000:
+            subs.insert(seed % 3, {"titleSlug": QUESTION_SLUG, "timestamp": str(self.now - 600)})
+        return subs[:limit]
+
+    def respond(self, body):
+        query = body.get("query", "")
+        variables = body.get("variables") or {}
+        if "activeDailyCodingChallengeQuestion" in query:
+            return 200, {"data": {"activeDailyCodingChallengeQuestion": {
+                "date": datetime.now(timezone.utc).strftime("%Y-%m-%d"),
+                "link": f"/problems/{QUESTION_SLUG}/",
+                "question": {
+                    "title": "Two Sum", "titleSlug": QUESTION_SLUG, "difficulty": "Medium",
+                    "hints": ["Use a hash map."], "acRate": 51.2, "topicTags": [{"name": "Array"}],
+                },
+            }}}
+        if self.max_in_flight and self.in_flight > self.max_in_flight:
+            with self.lock:
+                self.throttled += 1
+            return 429, {"errors": [{"message": "Too many requests"}]}
+        limit = variables.get("limit", 50)
+        if "username" in variables:
+            return 200, {"data": {"recentAcSubmissionList": self.submissions(variables["username"], limit)}}
+        return 200, {"data": {
+            alias: self.submissions(username, limit)
+            for alias, username in variables.items() if alias != "limit"
+        }}
+
+
+class FakeGemini(_Server):
+    """Answers generateContent with a fixed quote, or JSON matching the requested schema."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _JSONHandler)
+        self.server.fake = self
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/v1beta/models/fake:generateContent"
+
+    def respond(self, body):
+        config = body.get("generationConfig", {})
+        hints = ["Think about complements.", "A hash map gives O(1) lookups.", "Check before you insert.", "One pass is enough."]
+        if config.get("responseSchema", {}).get("type") == "OBJECT":
+            text = json.dumps({
+                "quote": "Do. Or do not. There is no try.\n- Yoda (The Empire Strikes Back).",
+                "hints_by_count": {str(n): hints[:n] for n in range(1, 5)},
+            })
+        elif config.get("responseMimeType") == "application/json":
+            text = json.dumps(hints)
+        else:
+            text = "Do. Or do not. There is no try.\n- Yoda (The Empire Strikes Back)."
+        return 200, {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+
+class FakeWebhook(_Server):
+    """
+    Accepts generic webhook ({"notifications": [...]}), Slack ("blocks") and
+    Discord ("embeds") posts, counting requests and the notifications in them.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        self.notifications = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _JSONHandler)
+        self.server.fake = self
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/hook"
+
+    def respond(self, body):
+        if "notifications" in body:
+            count = len(body["notifications"])
+        elif "embeds" in body:
+            count = len(body["embeds"])
+        else:
+            count = sum(block.get("type") == "section" for block in body.get("blocks") or [])
+        with self.lock:
+            self.notifications += count
+        return 200, {"ok": True}
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        sink = self.server.sink
+        with sink.lock:
+            sink.connections += 1
+        self.reply("220 fake-smtp ready")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.wfile.write(b"250-fake-smtp\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+            elif verb == "AUTH":
+                user = ""
+                parts = command.split()
+                if len(parts) == 3 and parts[1].upper() == "PLAIN":
+                    user = base64.b64decode(parts[2]).split(b"\0")[1].decode("utf-8", "replace")
+                if sink.fail_auth:
+                    self.reply("535 5.7.8 Authentication failed")
+                else:
+                    with sink.lock:
+                        sink.logins.append(user)
+                    self.reply("235 2.7.0 Authentication successful")
+            elif verb == "MAIL":
+                recipients = []
+                if sink.daily_limit is not None and sink.messages >= sink.daily_limit:
+                    self.reply("550 5.4.5 Daily user sending limit exceeded.")
+                else:
+                    self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command.split(":", 1)[1].strip(" <>"))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data == b".\r\n":
+                        break
+                    size += len(data)
+                if sink.latency:
+                    time.sleep(sink.latency)
+                with sink.lock:
+                    sink.messages += 1
+                    sink.bytes += size
+                    sink.recipients.extend(recipients)
+                self.reply("250 OK queued")
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SMTPSink(_Server):
+    """
+    Accepts (and counts) every message; no TLS, so run the bot with SMTP_STARTTLS off.
+    With `daily_limit`, MAIL FROM is refused like Gmail's sending limit once
+    that many messages were accepted.
+    """
+
+    def __init__(self, latency=0.0, fail_auth=False, daily_limit=None):
+        self.latency = latency
+        self.fail_auth = fail_auth
+        self.daily_limit = daily_limit
+        self.connections = 0
+        self.messages = 0
+        self.bytes = 0
+        self.recipients = []
+        self.logins = []
+        self.lock = threading.Lock()
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SMTPHandler)
+        self.server.sink = self
@@ -1,93 +1,120 @@
-import schedule
-import time
+import signal
 import sys
-import threading
-import itertools
-from src.core_logic import run_check
+from datetime import datetime, timezone
+from src.core_logic import run_check, take_over_shards, warm_daily_cache
 from src.config import validate_config
-from tqdm import tqdm
-import time
-from rich.console import Console
-from rich.panel import Panel
-from rich import print as rprint
-from src.leetcode_api import setup_cache_eviction
-
-spinner_running = True
-spinner_cycle = itertools.cycle(['-', '\\', '|', '/'])
-
-def spinner_thread():
-    """A simple thread to show a spinning cursor in the console."""
-    while spinner_running:
-        sys.stdout.write(next(spinner_cycle) + '\r')
-        sys.stdout.flush()
-        time.sleep(0.1)
-    sys.stdout.write(' \r')
-    sys.stdout.flush()
-
-def schedule_jobs():
-    """Sets up the scheduled times for the submission check."""
-    # Note: These times are UTC, which is standard for servers.
-    utc_times = ["03:30", "06:30", "13:30", "17:30"]
-    print(f"⏰ Scheduling jobs at the following UTC times: {', '.join(utc_times)}")
-    for t in utc_times:
-        schedule.every().day.at(t).do(run_check)
+from src import config
+from src import metrics
+from src import outbox
+from src.log_sink import get_sink
+from src.reminders import ReminderQueue, simulate, print_simulation
+from src.scheduler import Scheduler
+
+def is_headless(argv):
+    """
+    Headless (service) mode skips the rich banners. It is used with --headless,
+    BOT_HEADLESS=true, or automatically when stdout is not a terminal.
+    """
+    if "--headless" in argv or config.BOT_HEADLESS in ("1", "true", "yes"):
+        return True
+    if config.BOT_HEADLESS in ("0", "false", "no"):
+        return False
+    return not sys.stdout.isatty()
+
+def print_panel(text, title, border_style, padding):
+    """Prints a rich panel; rich is only imported when a terminal will show it."""
+    from rich.console import Console
+    from rich.panel import Panel
+    Console().print(Panel.fit(text, title=title, border_style=border_style, padding=padding))
+
+def option_value(argv, name, default):
+    """Returns the value of a `--name=value` option."""
+    prefix = f"--{name}="
+    return next((arg[len(prefix):] for arg in argv if arg.startswith(prefix)), default)
+
+def schedule_jobs(scheduler, reminders):
+    """Sets up the submission checks, each user at their own reminder times, and the background jobs."""
+    get_sink().info(f"⏰ Scheduling reminders for {len(reminders)} users at their own times")
+    # Note: the heap holds each user's next reminder; the job sleeps until the earliest one
+    scheduler.repeat(reminders.next_time, reminders.run_due, run_check, label="for due reminders")
+
+    # Generate the new question's Gemini content right after the 00:00 UTC rollover,
+    # retrying once in case LeetCode is late to publish it
+    for t in ["00:05", "00:35"]:
+        scheduler.every_day_at(t, warm_daily_cache)
+
+    # Finish the shards of replicas that died mid-run, without holding any run up
+    if config.SHARD_COUNT > 1:
+        scheduler.every(max(1, config.SHARD_LEASE_TTL / 3), take_over_shards)
+
+    # Send retries as they come due, outside the scheduled runs
+    scheduler.every(config.OUTBOX_DRAIN_INTERVAL, outbox.drain)
 
 def main():
     """Main function to start the bot."""
-    global spinner_running
-    console = Console()
-    
+    argv = sys.argv[1:]
+    if "--simulate" in argv:
+        # Show how the configured users' checks spread over the day, without running any
+        days = int(option_value(argv, "days", 1))
+        bucket_minutes = int(option_value(argv, "bucket", 60))
+        print_simulation(simulate(days=days, bucket_minutes=bucket_minutes), days, bucket_minutes)
+        return
+
+    headless = is_headless(argv)
+    scheduler = Scheduler()
+    reminders = ReminderQueue()
+
+    def shutdown(signum, frame):
+        get_sink().info(f"\nReceived {signal.Signals(signum).name}, shutting down after the current job...")
+        scheduler.stop()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
     # startup banner
-    console.print(Panel.fit(
-        "[bold yellow]LeetCode Reminder Bot[/bold yellow]\n\n"
-        "[blue]     Version 1.0[/blue]",
-        title="🤖 Welcome",
-        border_style="green",
-        padding=(1, 5)
-    ))
-    
-    # Initialize cache eviction scheduler
-    cache_scheduler = setup_cache_eviction()
-
-    with tqdm(total=100, 
-                desc="Initializing system",
-                colour='cyan',
-                ncols=75,
-                bar_format='{desc}: {percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt}') as pbar:
-            for i in range(10):
-                time.sleep(0.1)
-                pbar.update(10)
+    if headless:
+        get_sink().info("LeetCode Reminder Bot v1.0 starting (headless mode)")
+    else:
+        print_panel(
+            "[bold yellow]LeetCode Reminder Bot[/bold yellow]\n\n"
+            "[blue]     Version 1.0[/blue]",
+            title="🤖 Welcome",
+            border_style="green",
+            padding=(1, 5)
+        )
 
     if not validate_config():
         sys.exit(1) # Exit if secrets aren't set
 
-    # Run one check immediately on startup
+    metrics.start_server()
+
+    # Run one check immediately on startup: first finish sending whatever a
+    # previous process left in the outbox, then redo each user's latest reminder
+    # of today, which does not mail anyone that reminder already queued
     try:
-        run_check()
+        outbox.drain()
+        start_of_day = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        reminders.load(catch_up_since=start_of_day.timestamp())
+        reminders.run_due(run_check)
     except Exception as e:
-        print(f"\nAn error occurred during the initial run: {e}")
+        get_sink().error(f"\nAn error occurred during the initial run: {e}")
 
-    schedule_jobs()
-    print("\n  Scheduler is now running. Waiting for the next scheduled time...")
-    print("   (Running as a service. Press Ctrl+C to exit if running locally.)")
+    schedule_jobs(scheduler, reminders)
+    get_sink().info("\n  Scheduler is now running. Waiting for the next scheduled time... (Running as a service. Press Ctrl+C or send SIGTERM to stop.)")
 
-    t = threading.Thread(target=spinner_thread)
-    t.start()
+    scheduler.run_forever()
+    # Let chat/webhook requests in flight finish, so they are not sent again after a restart
+    outbox.wait_for_channel_drains(timeout=config.NOTIFY_TIMEOUT)
 
-    try:
-        while True:
-            schedule.run_pending()
-            time.sleep(1)
-    except KeyboardInterrupt:
-        print("\n")
-        rprint(Panel.fit(
+    if headless:
+        get_sink().info("Shutting down the bot.")
+    else:
+        print_panel(
             "[bold yellow]Shutting down the bot[/bold yellow]\nSending mail to admin",
             title=" Goodbye! :(",
             border_style="cyan",
             padding=(1, 4)
-        ))
-        spinner_running = False
-        t.join()
+        )
 
 if __name__ == "__main__":
     main()
@@ -14,8 +14,118 @@ SMTP_PASSWORD = os.getenv("GMAIL_APP_PASSWORD")
 
 SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+# Upgrade the SMTP connection with STARTTLS before logging in
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() in ("1", "true", "yes")
+# Authenticated SMTP sessions kept open during a run, and how many mails each one sends before reconnecting
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 1))
+SMTP_MAX_MESSAGES_PER_SESSION = int(os.getenv("SMTP_MAX_MESSAGES_PER_SESSION", 50))
+# Outbox sending limits per sender account, matched to Gmail's quotas (0 disables a limit)
+SMTP_SEND_PER_MINUTE = int(os.getenv("SMTP_SEND_PER_MINUTE", 60))
+SMTP_SEND_PER_DAY = int(os.getenv("SMTP_SEND_PER_DAY", 500))
+# More sender accounts (or relays) to spread mail over, as a JSON list of objects with "user" and
+# "password" and optionally "server", "port", "starttls", "per_minute", "per_day" and "name" (unset
+# ones take the SMTP_* values above). When set it replaces SMTP_USER / GMAIL_APP_PASSWORD.
+SMTP_ACCOUNTS = os.getenv("SMTP_ACCOUNTS", "").strip()
+SMTP_ACCOUNT_FIELDS = {"user", "password", "server", "port", "starttls", "per_minute", "per_day", "name"}
+# Seconds an account that hit a sending limit or failed to log in is skipped before it is tried again
+SMTP_ACCOUNT_COOLDOWN = float(os.getenv("SMTP_ACCOUNT_COOLDOWN", 900))
+# Chat and webhook notifications (users' "channels"): the bot that sends "telegram" messages,
+# how many notifications to one webhook or chat are combined into a request, how many requests
+# each channel has in flight, and how long a reply may take before the send counts as failed
+TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", 10))
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", 4))
+NOTIFY_TIMEOUT = float(os.getenv("NOTIFY_TIMEOUT", 10))
+# Failed sends are retried after OUTBOX_RETRY_BASE seconds, doubling each time, up to OUTBOX_MAX_ATTEMPTS tries
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+OUTBOX_RETRY_BASE = float(os.getenv("OUTBOX_RETRY_BASE", 60))
+OUTBOX_RETRY_MAX = float(os.getenv("OUTBOX_RETRY_MAX", 3600))
+# Seconds a drain's claim on outbox messages lasts unless renewed while it sends them. A process
+# that crashed leaves its claimed messages to the next drain after at most this long
+OUTBOX_CLAIM_TTL = float(os.getenv("OUTBOX_CLAIM_TTL", 120))
+# Seconds between background passes that send retries still waiting in the outbox
+OUTBOX_DRAIN_INTERVAL = int(os.getenv("OUTBOX_DRAIN_INTERVAL", 60))
+# Strip indentation and blank lines from the compiled email HTML
+EMAIL_MINIFY = os.getenv("EMAIL_MINIFY", "true").lower() in ("1", "true", "yes")
 LEETCODE_API_URL = os.getenv("LEETCODE_API_URL", "https://leetcode.com/graphql")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_API_URL = os.getenv(
+    "GEMINI_API_URL",
+    "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-09-2025:generateContent"
+)
+
+# Users file: a JSON array (users.json) or one JSON object per line (.jsonl)
+USERS_FILE = os.getenv("USERS_FILE")
+# Users per batch passed between the stages of a run (fetch -> decide -> render -> send)
+USER_CHUNK_SIZE = int(os.getenv("USER_CHUNK_SIZE", 100))
+# Batches that may wait in front of each stage; once full, the stage before it waits,
+# so a slow SMTP server slows fetching down instead of letting batches pile up
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 2))
+# Worker threads per stage; 0 senders means one per pooled SMTP session of every sender account
+PIPELINE_FETCH_WORKERS = int(os.getenv("PIPELINE_FETCH_WORKERS", 2))
+PIPELINE_DECIDE_WORKERS = int(os.getenv("PIPELINE_DECIDE_WORKERS", 1))
+PIPELINE_RENDER_WORKERS = int(os.getenv("PIPELINE_RENDER_WORKERS", 1))
+PIPELINE_SEND_WORKERS = int(os.getenv("PIPELINE_SEND_WORKERS", 0))
+
+# Reminder times for users whose record has no "timezone" / "reminder_times" (local HH:MM, comma separated).
+# The defaults are the original 03:30, 06:30, 13:30 and 17:30 UTC slots in IST.
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Asia/Kolkata")
+DEFAULT_REMINDER_TIMES = [t.strip() for t in os.getenv("DEFAULT_REMINDER_TIMES", "09:00,12:00,19:00,23:00").split(",") if t.strip()]
+# Users due within the same N-minute window are checked in one run at its start, and each user's
+# messages go out a stable 1..N minutes before their time so they are not all sent at once; earlier
+# rather than later, so a time chosen just before the 00:00 UTC rollover stays before it
+REMINDER_SPREAD_MINUTES = int(os.getenv("REMINDER_SPREAD_MINUTES", 15))
+
+# Users without their own "reminder_times" are checked when their past solve times say it matters:
+# PLANNER_LEAD_MINUTES before they usually start solving and PLANNER_FINAL_MINUTES before the
+# 00:00 UTC rollover, once PLANNER_MIN_SAMPLES solves have been seen
+ADAPTIVE_POLLING = os.getenv("ADAPTIVE_POLLING", "true").lower() in ("1", "true", "yes")
+PLANNER_MIN_SAMPLES = int(os.getenv("PLANNER_MIN_SAMPLES", 5))
+PLANNER_LEAD_MINUTES = int(os.getenv("PLANNER_LEAD_MINUTES", 60))
+PLANNER_FINAL_MINUTES = int(os.getenv("PLANNER_FINAL_MINUTES", 60))
+
+# "true" runs main.py as a plain-logging service, "false" forces the terminal UI, "auto" decides by TTY
+BOT_HEADLESS = os.getenv("BOT_HEADLESS", "auto").lower()
+
+# Run logs: "spinner" (Halo spinners), "json" (one JSON object per line) or "auto" (spinners only on a TTY)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "auto").lower()
+
+# Prometheus-style /metrics endpoint served by main.py; set METRICS_PORT=0 to disable
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9108))
+
+# sqlite file holding caches and run state; keep it on a volume so it survives restarts
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", os.path.join("data", "bot_state.db"))
+# Directory of the per-year solve-history bitmaps used for streaks
+SOLVE_HISTORY_DIR = os.getenv("SOLVE_HISTORY_DIR", os.path.join("data", "solve_history"))
+
+# --- Sharding across replicas that share STATE_DB_PATH ---
+# Each replica gets the same SHARD_COUNT and its own SHARD_INDEX (0..SHARD_COUNT-1)
+SHARD_COUNT = max(1, int(os.getenv("SHARD_COUNT", 1)))
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", 0))
+# Seconds without a heartbeat before another replica takes a shard over
+SHARD_LEASE_TTL = float(os.getenv("SHARD_LEASE_TTL", 300))
+
+# LeetCode requests in flight at once: starts at LEETCODE_MAX_CONCURRENCY, then grows by one per
+# round of fast, successful requests up to LEETCODE_CONCURRENCY_CEILING, and halves on 429s, 5xx,
+# timeouts or responses slower than LEETCODE_LATENCY_TARGET seconds (AIMD)
+LEETCODE_MAX_CONCURRENCY = int(os.getenv("LEETCODE_MAX_CONCURRENCY", 8))
+LEETCODE_CONCURRENCY_CEILING = max(LEETCODE_MAX_CONCURRENCY, int(os.getenv("LEETCODE_CONCURRENCY_CEILING", 32)))
+LEETCODE_LATENCY_TARGET = float(os.getenv("LEETCODE_LATENCY_TARGET", 2.0))
+# Number of users checked per GraphQL request (aliased batch query)
+LEETCODE_BATCH_SIZE = int(os.getenv("LEETCODE_BATCH_SIZE", 10))
+# Recent submissions requested per user on the first try; widened only when needed
+LEETCODE_SUBMISSION_LIMIT = int(os.getenv("LEETCODE_SUBMISSION_LIMIT", 5))
+
+# --- Outbound HTTP (LeetCode and Gemini) ---
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 30))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 3))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", 0.5))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", 30))
+# Keep-alive connections per host; enough for every concurrent LeetCode fetch
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", max(10, LEETCODE_CONCURRENCY_CEILING)))
 
 # --- GraphQL Queries ---
 QUERY_DAILY_QUESTION = """
@@ -46,33 +156,43 @@ query recentAcSubmissions($username: String!, $limit: Int!) {
 }
 """
 
-# --- Helper Functions ---
+# One aliased field per user in a batched query, see leetcode_api.build_batch_query
+QUERY_RECENT_SUBMISSIONS_ALIAS = """
+  u{index}: recentAcSubmissionList(username: $u{index}, limit: $limit) {{
+    titleSlug
+    timestamp
+  }}"""
 
-def load_users():
-    """Loads the user list from users.json."""
-    users_filepath = 'users.json' # place users.json in the root
-    if not os.path.exists(users_filepath):
-        # local testing
-        users_filepath = os.path.join(os.path.dirname(__file__), '..', 'users.json')
-
-    try:
-        with open(users_filepath, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print(" users.json file not found at {users_filepath}.")
-        return []
-    except json.JSONDecodeError:
-        print(f" Error: {users_filepath} is not valid JSON.")
-        return []
+# --- Helper Functions ---
 
 def validate_config():
     """Checks if essential secrets are loaded."""
-    if not SMTP_USER or not SMTP_PASSWORD:
-        print(" FATAL ERROR: SMTP_USER or GMAIL_APP_PASSWORD is not set.")
-        print("  Please set these environment variables before running.")
-        print("  If running locally, check your .env file.")
+    # log_sink reads its format from this module, so it is imported late
+    from .log_sink import get_sink
+    if SMTP_ACCOUNTS:
+        try:
+            accounts = json.loads(SMTP_ACCOUNTS)
+            valid = isinstance(accounts, list) and accounts and all(
+                isinstance(account, dict) and account.get("user") and account.get("password")
+                and set(account) <= SMTP_ACCOUNT_FIELDS
+                for account in accounts
+            )
+        except ValueError:
+            valid = False
+        if not valid:
+            get_sink().error(
+                " FATAL ERROR: SMTP_ACCOUNTS must be a JSON list of objects with \"user\" and \"password\""
+                f" and optionally {', '.join(sorted(SMTP_ACCOUNT_FIELDS - {'user', 'password'}))}."
+            )
+            return False
+    elif not SMTP_USER or not SMTP_PASSWORD:
+        get_sink().error(
+            " FATAL ERROR: SMTP_USER or GMAIL_APP_PASSWORD is not set."
+            " Please set these environment variables before running."
+            " If running locally, check your .env file."
+        )
         return False
     
-    print("Configuration and secrets loaded successfully.")
+    get_sink().info("Configuration and secrets loaded successfully.")
     return True
 
@@ -1,10 +1,33 @@
 import random
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from . import config
 from . import leetcode_api
-from halo import Halo
 from . import email_service
 from . import gemini_service 
+from . import solved_store
+from . import submission_sync
+from . import sharding
+from . import outbox
+from . import solve_history
+from . import poll_planner
+from . import pipeline
+from . import notifier
+from . import user_store
+from . import metrics
+from .log_sink import get_sink
+
+
+def chunked(iterable, size):
+    """Yields lists of up to `size` items from iterable without materialising it."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, max(1, size)))
+        if not chunk:
+            return
+        yield chunk
 
 
 def get_hint_count(difficulty, acRate):
@@ -23,89 +46,322 @@ def get_hint_count(difficulty, acRate):
     return 2 # Default fallback
 
 
-def run_check():
-    """Main logic to check submissions for each user and send emails."""
+def warm_daily_cache():
+    """
+    Fetches the new daily question and generates its Gemini content ahead of
+    the scheduled runs, so it is served from the cache.
+    """
+    question_data = leetcode_api.get_daily_question()
+    if not question_data:
+        get_sink().info("Cache warm-up skipped since daily question could not be fetched.")
+        return
+
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    if question_data['date'] != today:
+        get_sink().info(f"Cache warm-up skipped, LeetCode still serves the question for {question_data['date']}.")
+        return
+
+    q_details = question_data['question']
+    gemini_service.get_daily_content(q_details, question_data['date'])
+    get_sink().info(f"Warmed the cache for '{q_details['title']}'.")
+
+
+class CheckRun:
+    """
+    State shared by every user checked in one run: the daily question, the
+    background Gemini content, the compiled email templates and the mailer,
+    plus the stages of the pipeline each batch of users goes through.
+    """
+
+    def __init__(self, question_data, day_window, content_future, hint_count, mailer, run_key):
+        self.question_data = question_data
+        self.q_details = question_data['question']
+        self.day_start, self.day_end = day_window
+        # Yesterday's question, to catch solves made after its last check
+        self.previous_question = solve_history.previous_question(question_data['date'])
+        self.content_future = content_future
+        self.hint_count = hint_count
+        self.mailer = mailer
+        self.run_key = run_key
+        self.ai_content = None
+        self.templates = {}
+        self.payloads = set()
+        self._templates_lock = threading.Lock()
+        self.lease = None
+        self.sink = get_sink()
+
+    def content(self):
+        """Waits on the quote and hints the first time an email needs them."""
+        if self.ai_content is None:
+            with self.sink.stage("gemini", 'Fetching quote and hints from gemini...', spinner='balloon2', color='cyan') as spinner:
+                try:
+                    self.ai_content = self.content_future.result()
+                    spinner.succeed('Quote and hints generated successfully!')
+                except Exception as e:
+                    spinner.fail(f'Failed to get quote and hints: {e}')
+                    self.ai_content = {
+                        "quote": gemini_service.DEFAULT_QUOTE,
+                        "hints_by_count": {self.hint_count: gemini_service.DEFAULT_HINTS[:self.hint_count]},
+                    }
+        return self.ai_content
+
+    def quote(self):
+        """One AI quote for everyone for this run."""
+        return self.content()["quote"]
+
+    def hints(self):
+        """The hint set matching today's difficulty and acceptance rate."""
+        return self.content()["hints_by_count"][self.hint_count]
+
+    def template_id(self, solved):
+        """
+        Each variant is compiled once, the first time a user needs it, and
+        stored in the outbox for the messages that use it.
+        """
+        template_id = f"{self.run_key}/{'solved' if solved else 'reminder'}"
+        with self._templates_lock:
+            if solved not in self.templates:
+                template = email_service.compile_html_email(
+                    title=self.q_details['title'],
+                    difficulty=self.q_details['difficulty'],
+                    link=self.question_data['fullLink'],
+                    solved=solved,
+                    quote=self.quote(),
+                    hints=[] if solved else self.hints(),
+                )
+                subject = "Awesome! You solved today’s LeetCode challenge!" if solved else "⏳ Reminder: Solve Today’s LeetCode Problem!"
+                outbox.save_template(template_id, subject, template)
+                self.templates[solved] = template
+        return template_id
+
+    def payload_id(self, solved):
+        """Like template_id, for the payload of chat and webhook notifications."""
+        payload_id = f"{self.run_key}/{'solved' if solved else 'reminder'}/notify"
+        with self._templates_lock:
+            if payload_id not in self.payloads:
+                outbox.save_payload(payload_id, notifier.build_payload(
+                    title=self.q_details['title'],
+                    difficulty=self.q_details['difficulty'],
+                    link=self.question_data['fullLink'],
+                    solved=solved,
+                    quote=self.quote(),
+                    hints=[] if solved else self.hints(),
+                ))
+                self.payloads.add(payload_id)
+        return payload_id
+
+    def heartbeat(self):
+        if self.lease:
+            self.lease.heartbeat()
+
+    def fetch(self, users):
+        """Pipeline stage: fetches a batch of users' submissions."""
+        with self.sink.stage("fetch_submissions", f'Fetching submissions for {len(users)} users...', spinner='star2', color='cyan', users=len(users)) as spinner:
+            # Reach back to yesterday's window too, so a late solve of it is seen
+            since = self.previous_question["start"] if self.previous_question else self.day_start
+            all_submissions = submission_sync.sync_submissions((user["username"] for user in users), since)
+            spinner.succeed('Submissions fetched successfully!')
+        self.heartbeat()
+        return users, all_submissions
+
+    def decide(self, fetched):
+        """
+        Pipeline stage: decides who solved today's question, records it (plus
+        any late solve of yesterday's) and works out everyone's streak. Users whose submissions could not be
+        fetched are left for their next reminder rather than reminded on a guess.
+        Returns (user, solved today, (current, longest) streak) per user.
+        """
+        users, all_submissions = fetched
+        q_details = self.q_details
+
+        solved_today_by_user = {}
+        checked = []
+        for user in users:
+            username = user["username"]
+            self.sink.console(f"\n🔍 Checking user: {username}")
+
+            submissions = all_submissions[username]
+            if submissions is None:
+                self.sink.info(f" Could not check [ {username} ], skipping them this run.", stage="decide", username=username, unknown=True)
+                continue
+
+            solved_sub = next((
+                sub for sub in submissions
+                if sub["titleSlug"] == q_details["titleSlug"] and self.day_start <= int(sub["timestamp"]) < self.day_end
+            ), None)
+            solved_today = solved_sub is not None
+            solved_today_by_user[username] = solved_today
+            checked.append(user)
+
+            self.sink.info(
+                f"[ {username} ] has already solved the daily problem." if solved_today else
+                f" [ {username} ] has not solved the daily problem yet sending reminder...",
+                stage="decide", username=username, solved=solved_today,
+            )
+            if solved_today:
+                solved_store.mark_solved(self.question_data['date'], username, int(solved_sub["timestamp"]))
+            else:
+                self.sink.console(f"Difficulty: {q_details['difficulty']}, AC Rate: {format(float(q_details['acRate']), '.2f')}% ")
+
+        date = self.question_data['date']
+        backfilled = solve_history.backfill(all_submissions, self.previous_question)
+        if backfilled:
+            self.sink.info(f"Recorded {len(backfilled)} late solves of {self.previous_question['date']}'s problem.", stage="decide", backfilled=len(backfilled))
+        solve_history.record_solves((username for username, solved in solved_today_by_user.items() if solved), date)
+        streaks = solve_history.streaks(solved_today_by_user, date)
+        poll_planner.observe(all_submissions)
+        submission_sync.record_seen(all_submissions)
+        self.heartbeat()
+        return [(user, solved_today_by_user[user["username"]], streaks[user["username"]]) for user in checked] or None
+
+    @metrics.timed("render")
+    def render(self, decided):
+        """
+        Pipeline stage: builds each user's solved or reminder message for
+        every channel they chose into the outbox: emails from the run's
+        compiled template, chat and webhook notifications from its payload,
+        each plus the user's own values, due at the user's "send_at" if the
+        run set one. Returns the number of messages queued.
+        """
+        queued = 0
+        for user, solved_today, streak in decided:
+            username = user["username"]
+            recipients = notifier.recipients(user)
+            emails = [recipient for recipient in recipients if notifier.is_email(recipient)]
+            channels = [recipient for recipient in recipients if not notifier.is_email(recipient)]
+
+            # A restarted run, or another replica that crashed mid-shard, may have queued this user already
+            added = 0
+            if emails:
+                streak_html = email_service.format_streak(*streak, solved_today)
+                added += outbox.enqueue(self.run_key, username, emails, self.template_id(solved_today), {"streak_html": streak_html}, user.get("send_at"))
+            if channels:
+                streak_values = {"current_streak": streak[0], "longest_streak": streak[1]}
+                added += outbox.enqueue(self.run_key, username, channels, self.payload_id(solved_today), streak_values, user.get("send_at"))
+            if recipients and not added:
+                self.sink.info(f"[ {username} ] was already mailed in this run.", stage="send_email", username=username, skipped=True)
+            queued += added
+        self.heartbeat()
+        return queued or None
+
+    def send(self, queued):
+        """
+        Pipeline stage: sends as many due messages from the outbox as the
+        batch queued. Each sender claims its own messages; those due later
+        are left for the periodic drain.
+        """
+        owner = f"{sharding.replica_name()}/{threading.current_thread().name}"
+        outbox.drain(self.mailer, owner=owner, heartbeat=self.heartbeat, limit=queued)
+
+    def check_users(self, users, lease=None):
+        """
+        Streams users through the fetch -> decide -> render -> send stages,
+        USER_CHUNK_SIZE users per batch, then sends whatever else is due
+        (e.g. retries) from the outbox.
+        """
+        self.lease = lease
+        stages = [
+            pipeline.Stage("fetch", self.fetch, config.PIPELINE_FETCH_WORKERS),
+            pipeline.Stage("decide", self.decide, config.PIPELINE_DECIDE_WORKERS),
+            pipeline.Stage("render", self.render, config.PIPELINE_RENDER_WORKERS),
+            pipeline.Stage("send", self.send, config.PIPELINE_SEND_WORKERS or self.mailer.session_count),
+        ]
+        run = pipeline.Pipeline(stages, queue_size=config.PIPELINE_QUEUE_SIZE)
+        run.run(chunked(users, config.USER_CHUNK_SIZE))
+        outbox.drain(self.mailer, heartbeat=self.heartbeat)
+        self.sink.info(
+            "Most batches waiting per stage: " + ", ".join(f"{name}={peak}" for name, peak in run.peaks.items()),
+            stage="pipeline", queue_peaks=run.peaks,
+        )
+
+
+@metrics.timed("run_check")
+def run_check(run_slot="startup", users=None, shards=None):
+    """
+    Main logic to check submissions for each user and send emails.
+    `run_slot` names the scheduled run; replicas sharing a state database
+    split the users of the same slot between them.
+    `users` limits the run to those users (the ones due now) instead of
+    everyone in the users file: user dicts in anything that can be iterated
+    more than once, such as a user_store.UserSelection.
+    `shards` are the shards to process instead of this replica's own, when
+    taking over from another replica (see take_over_shards).
+    """
+    sink = get_sink()
     ist_now = datetime.utcnow() + timedelta(hours=5, minutes=30)
-    print(f"\n[{ist_now.strftime('%Y-%m-%d %I:%M:%S %p %a')} IST] Starting submission check...")
+    sink.info(f"\n[{ist_now.strftime('%Y-%m-%d %I:%M:%S %p %a')} IST] Starting submission check...")
 
     # Get all question data
     question_data = leetcode_api.get_daily_question()
     if not question_data:
-        print("Aborting check since daily question could not be fetched.")
+        sink.info("Aborting check since daily question could not be fetched.")
         return
     
     q_details = question_data['question']
-    q_link = question_data['fullLink']
 
-    print(f"Today's POTD is '{q_details['title']}' ({q_details['difficulty']})")
-    today = ist_now.date()
+    sink.info(f"Today's POTD is '{q_details['title']}' ({q_details['difficulty']})")
+    run_key = f"{question_data['date']}/{run_slot}"
+
+    # Start the Gemini call now so it runs while submissions are being fetched
+    hint_count = get_hint_count(q_details['difficulty'], q_details['acRate'])
+    gemini_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gemini")
+    content_future = gemini_pool.submit(gemini_service.get_daily_content, q_details, question_data['date'])
+    gemini_pool.shutdown(wait=False)
     
-    users = config.load_users()
-    if not users:
-        print("No users loaded from users.json. Exiting check.")
+    store = user_store.default_store()
+    user_count = store.count() if users is None else len(users)
+    if not user_count:
+        sink.info("No users loaded from users.json. Exiting check.")
         return
 
-     # Get one AI quote for everyone for this run
-    with Halo(text='Fetching quote from gemini...', spinner='balloon2', color='cyan') as spinner:
-        try:
-            ai_quote = gemini_service.get_motivational_quote()
-            spinner.succeed('Quote fetched successfully!')
-        except Exception as e:
-            spinner.fail(f'Failed to get motivational quote: {e}')   
-
-    ai_hints = [] 
-  
-    for user in users:
-        username, email = user["username"], user["email"]
-        print(f"\n🔍 Checking user: {username}")
-        
-        with Halo(text='Fetching submissions...', spinner='star2', color='cyan') as spinner:
-            submissions = leetcode_api.get_recent_submissions(username)
-            spinner.succeed('Submissions fetched successfully!')
+    # Users confirmed as solved by an earlier run today need neither a fetch nor another mail
+    solved_store.prune(question_data['date'])
+    sharding.prune(question_data['date'])
+    outbox.prune(question_data['date'])
+    already_solved = solved_store.solved_usernames(question_data['date'])
+    # Only users still in this run count: the store also remembers users removed from the file since
+    skipped = store.count_named(already_solved) if users is None else sum(user["username"] in already_solved for user in users)
+    if skipped:
+        sink.info(f"Skipping {skipped} users who already solved today's problem.")
+    if skipped >= user_count:
+        sink.info("Every user has already solved today's problem. Exiting check.")
+        return
 
-        solved_today = any(
-            sub["titleSlug"] == q_details["titleSlug"] and
-            (datetime.fromtimestamp(int(sub["timestamp"])) + timedelta(hours=5, minutes=30)).date() == today
-            for sub in submissions
-        )
+    with email_service.MailerGroup() as mailer:
+        day_window = submission_sync.question_day_window(question_data['date'])
+        solve_history.remember_question(question_data['date'], q_details['titleSlug'], day_window)
+        run = CheckRun(question_data, day_window, content_future, hint_count, mailer, run_key)
+        if config.SHARD_COUNT > 1 and shards is None:
+            usernames = getattr(users, "usernames", None) if users is not None else None
+            if users is not None and usernames is None:
+                usernames = [user["username"] for user in users]
+            sharding.register_run(run_key, usernames)
+        for lease in sharding.claim_shards(run_key, shards=shards):
+            if shards is not None:
+                sink.info(f"\nTaking over shard {lease.shard + 1}/{config.SHARD_COUNT}, which its replica did not finish")
+            elif config.SHARD_COUNT > 1:
+                sink.info(f"\nProcessing shard {lease.shard + 1}/{config.SHARD_COUNT}")
+            # Stream the store through the pipeline so memory stays flat however many users there are
+            shard_users = (
+                user for user in (store.iter_users() if users is None else users)
+                if user["username"] not in already_solved and sharding.shard_for(user["username"]) == lease.shard
+            )
+            run.check_users(shard_users, lease)
+            lease.complete()
 
+    sink.info("\n--- Check complete ---")
 
-        if solved_today:
-            print(f"[ {username} ] has already solved the daily problem.")
-            subject = "Awesome! You solved today’s LeetCode challenge!"
-        else:
-            print(f" [ {username} ] has not solved the daily problem yet sending reminder...")
-            subject = "⏳ Reminder: Solve Today’s LeetCode Problem!"
-
-            
-            print(f"Difficulty: {q_details['difficulty']}, AC Rate: {format(float(q_details['acRate']), '.2f')}% ")
-
-            if len(ai_hints) == 0:
-                    hint_count = get_hint_count(q_details['difficulty'], q_details['acRate'])
-                    with Halo(text='Generating Hints...', spinner='arrow3', color='blue') as spinner:
-                        try:
-                            ai_hints = gemini_service.generate_optimal_hints(q_details, hint_count)
-                            spinner.succeed('Hints generated successfully!')
-                        except Exception as e:
-                            spinner.fail(f'Failed to generate hints: {e}')
-                            ai_hints = gemini_service.DEFAULT_HINTS    
-            
-        
-        html = email_service.build_html_email(
-            username=username,
-            title=q_details['title'],
-            difficulty=q_details['difficulty'], 
-            link=q_link,
-            solved=solved_today,
-            quote=ai_quote,
-            hints=ai_hints,
-        )
-        
-        with Halo(text='Sending mail..', spinner='bouncingBar', color='yellow') as spinner:
-            try:
-                email_service.send_email(email, subject, html)
-                spinner.succeed(f"Mail sent successfully! to user {username}")
-            except Exception as e:
-                spinner.fail(f'Failed to send mail: {e}')
-
-    print("\n--- Check complete ---")
+
+def take_over_shards():
+    """
+    Finishes the shards of today's runs that another replica left behind:
+    it crashed mid-run or never started it. Runs as its own scheduled job,
+    so no run waits on the other replicas.
+    """
+    question_data = leetcode_api.get_daily_question()
+    if not question_data:
+        return
+    store = user_store.default_store()
+    for run_key, usernames, shards in sharding.orphaned_shards(question_data['date']):
+        users = None if usernames is None else store.select(usernames)
+        run_check(run_slot=run_key.partition("/")[2], users=users, shards=shards)
@@ -1,40 +1,291 @@
+import re
+import json
 import smtplib
+import queue
+import threading
 from email.message import EmailMessage
 from . import config
+from . import metrics
+from .log_sink import get_sink
 from datetime import datetime, timezone, timedelta
 
-def send_email(to_email, subject, html_content):
-    """Sends an email using the configured SMTP settings."""
-   
-    if not config.SMTP_USER or not config.SMTP_PASSWORD:
-        print(f"[ERROR] SMTP not configured. Skipping email to {to_email}")
-        return False
+def build_message(to_email, subject, html_content, sender=None):
+    """Builds the multipart reminder message for one recipient."""
+    msg = EmailMessage()
+    msg['From'] = f"LeetCode Reminder Bot <{sender or config.SMTP_USER}>"
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.set_content("This email requires HTML support to be viewed correctly.")
+    msg.add_alternative(html_content, subtype='html')
+    return msg
+
+
+class SenderAccount:
+    """
+    One SMTP login (or relay) mail can be sent from, with its own sending
+    limits. Settings left out fall back to the SMTP_* configuration.
+    """
+
+    def __init__(self, user, password, server=None, port=None, starttls=None, per_minute=None, per_day=None, name=None):
+        self.user = user
+        self.password = password
+        self.server = server or config.SMTP_SERVER
+        self.port = int(port or config.SMTP_PORT)
+        self.starttls = config.SMTP_STARTTLS if starttls is None else bool(starttls)
+        self.per_minute = config.SMTP_SEND_PER_MINUTE if per_minute is None else int(per_minute)
+        self.per_day = config.SMTP_SEND_PER_DAY if per_day is None else int(per_day)
+        # Sends are counted against the daily quota under this name
+        self.name = name or user
+
+    def __repr__(self):
+        return f"SenderAccount({self.name!r})"
+
+
+def sender_accounts():
+    """The accounts to send from: SMTP_ACCOUNTS, or just SMTP_USER when it is unset."""
+    if config.SMTP_ACCOUNTS:
+        return [SenderAccount(**entry) for entry in json.loads(config.SMTP_ACCOUNTS)]
+    if config.SMTP_USER and config.SMTP_PASSWORD:
+        return [SenderAccount(config.SMTP_USER, config.SMTP_PASSWORD)]
+    return []
+
 
-    try:
-        msg = EmailMessage()
-        msg['From'] = f"LeetCode Reminder Bot <{config.SMTP_USER}>"
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        msg.set_content("This email requires HTML support to be viewed correctly.")
-        msg.add_alternative(html_content, subtype='html')
+class SenderUnavailable(Exception):
+    """The account cannot send at all right now: its login failed or it hit a sending limit."""
 
-        with smtplib.SMTP(config.SMTP_SERVER, config.SMTP_PORT) as smtp:
-            smtp.starttls()
-            smtp.login(config.SMTP_USER, config.SMTP_PASSWORD)
-            smtp.send_message(msg)
+    def __init__(self, account, reason):
+        super().__init__(f"{account.name}: {reason}")
+        self.account = account
+        self.reason = reason
 
+
+# Replies about the account rather than one message: 421 service unavailable or throttled,
+# 454 too many logins / temporary auth failure, 530/534/535 authentication required or refused
+ACCOUNT_REPLY_CODES = {421, 454, 530, 534, 535}
+# Enhanced status codes about the account: 5.4.5 is Gmail's daily sending limit
+ACCOUNT_STATUS_CODES = {"5.4.5"}
+ENHANCED_STATUS = re.compile(r"^\s*(\d\.\d{1,3}\.\d{1,3})\b")
+
+
+def _account_unavailable(error):
+    """
+    True when an SMTP error is about the account (refused login, sending
+    limit, relay unreachable) rather than about one message, judged by the
+    reply and enhanced status codes only: a 552 "message size limits" reply
+    must not take the whole account out.
+    """
+    if isinstance(error, smtplib.SMTPAuthenticationError):
         return True
-    except smtplib.SMTPAuthenticationError:
-        print(f"\n Authentication failed for {config.SMTP_USER}.")
-        print("  Please check that your GMAIL_APP_PASSWORD is correct.")
-        return False
-    except Exception as e:
-        print(f"\n Failed to send email to {to_email}: {e}")
+    if isinstance(error, smtplib.SMTPResponseException):
+        if error.smtp_code in ACCOUNT_REPLY_CODES:
+            return True
+        text = error.smtp_error.decode("utf-8", "replace") if isinstance(error.smtp_error, bytes) else str(error.smtp_error)
+        status = ENHANCED_STATUS.match(text)
+        return bool(status) and status.group(1) in ACCOUNT_STATUS_CODES
+    return isinstance(error, ConnectionError)
+
+
+class Mailer:
+    """
+    Keeps up to `pool_size` authenticated SMTP sessions of one sender account
+    open for a whole run and sends many messages on each of them.
+    A session is replaced after `max_messages_per_session` messages, and
+    reopened automatically if the server drops it.
+    """
+
+    def __init__(self, pool_size=None, max_messages_per_session=None, account=None):
+        if account is None:
+            account = next(iter(sender_accounts()), None)
+        self.account = account
+        self.pool_size = max(1, pool_size or config.SMTP_POOL_SIZE)
+        self.max_messages_per_session = max(1, max_messages_per_session or config.SMTP_MAX_MESSAGES_PER_SESSION)
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.account.server, self.account.port)
+        try:
+            if self.account.starttls:
+                smtp.starttls()
+            smtp.login(self.account.user, self.account.password)
+        except Exception:
+            self._quit(smtp)
+            raise
+        with self._lock:
+            self._open.append(smtp)
+        return [smtp, 0]
+
+    def _quit(self, smtp):
+        with self._lock:
+            if smtp in self._open:
+                self._open.remove(smtp)
+        try:
+            smtp.quit()
+        except Exception:
+            smtp.close()
+
+    def _send_on_session(self, msg):
+        try:
+            session = self._idle.get_nowait()
+        except queue.Empty:
+            session = self._connect()
+
+        try:
+            session[0].send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # The server closed an idle or exhausted session; retry once on a fresh one
+            self._quit(session[0])
+            session = self._connect()
+            try:
+                session[0].send_message(msg)
+            except Exception:
+                self._quit(session[0])
+                raise
+        except Exception:
+            self._idle.put(session)
+            raise
+
+        session[1] += 1
+        if session[1] >= self.max_messages_per_session:
+            self._quit(session[0])
+        else:
+            self._idle.put(session)
+
+    def send(self, to_email, subject, html_content):
+        """Sends one email over a pooled session. Returns True on success, False otherwise."""
+        try:
+            return self.deliver(to_email, subject, html_content)
+        except SenderUnavailable as e:
+            if isinstance(e.__cause__, smtplib.SMTPAuthenticationError):
+                get_sink().error(f"\n Authentication failed for {self.account.user}. Please check that your GMAIL_APP_PASSWORD is correct.")
+            else:
+                get_sink().error(f"\n Failed to send email to {to_email}: {e}")
+            return False
+
+    def deliver(self, to_email, subject, html_content):
+        """
+        Sends one email over a pooled session. Returns True on success and
+        False when this message failed; raises SenderUnavailable when the
+        account itself cannot send, so the caller can use another one.
+        """
+        with metrics.track("send_email") as stage:
+            if self.account is None:
+                get_sink().error(f"[ERROR] SMTP not configured. Skipping email to {to_email}")
+                stage.fail()
+                return False
+            try:
+                msg = build_message(to_email, subject, html_content, self.account.user)
+                with self._slots:
+                    self._send_on_session(msg)
+                return True
+            except Exception as e:
+                if _account_unavailable(e):
+                    raise SenderUnavailable(self.account, e) from e
+                get_sink().error(f"\n Failed to send email to {to_email}: {e}")
+                stage.fail()
+                return False
+
+    def close(self):
+        """Closes every open SMTP session."""
+        with self._lock:
+            sessions = list(self._open)
+        for smtp in sessions:
+            self._quit(smtp)
+        while not self._idle.empty():
+            self._idle.get_nowait()
+
+
+class MailerGroup:
+    """
+    A Mailer per sender account, so mail can be spread over several Gmail
+    accounts or relays. send() fails over from one account to the next;
+    the outbox instead picks an account per message by its quotas and
+    sends through send_as().
+    """
+
+    def __init__(self, accounts=None, pool_size=None, max_messages_per_session=None):
+        self.accounts = list(accounts) if accounts is not None else sender_accounts()
+        self.pool_size = max(1, pool_size or config.SMTP_POOL_SIZE)
+        self.mailers = {
+            account.name: Mailer(self.pool_size, max_messages_per_session, account) for account in self.accounts
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def session_count(self):
+        """SMTP sessions that may be open at once over all accounts."""
+        return self.pool_size * max(1, len(self.accounts))
+
+    def send_as(self, account, to_email, subject, html_content):
+        """Sends from `account`; see Mailer.deliver."""
+        return self.mailers[account.name].deliver(to_email, subject, html_content)
+
+    def send(self, to_email, subject, html_content):
+        """Sends from the first account that can. Returns True on success, False otherwise."""
+        if not self.accounts:
+            get_sink().error(f"[ERROR] SMTP not configured. Skipping email to {to_email}")
+            return False
+        for account in self.accounts:
+            try:
+                return self.send_as(account, to_email, subject, html_content)
+            except SenderUnavailable as e:
+                get_sink().error(f"\n Sender {account.name} cannot send: {e.reason}. Trying the next one.")
+        get_sink().error(f"\n No sender account could send the email to {to_email}.")
         return False
 
+    def close(self):
+        """Closes every account's SMTP sessions."""
+        for mailer in self.mailers.values():
+            mailer.close()
+
 
-def build_html_email(username, title, difficulty, link, solved, quote=None, hints=None):
-    """Builds a responsive email with optional AI hints, quotes, and a live countdown GIF."""
+def send_email(to_email, subject, html_content, mailer=None):
+    """
+    Sends an email using the configured SMTP settings.
+    Pass a Mailer or MailerGroup to reuse its open sessions; otherwise a
+    one-off connection is used, failing over between sender accounts.
+    """
+    if mailer is not None:
+        return mailer.send(to_email, subject, html_content)
+
+    with MailerGroup(pool_size=1) as one_off:
+        return one_off.send(to_email, subject, html_content)
+
+
+def format_streak(current, longest, solved):
+    """Returns the streak line shown under the intro text, or "" when there is no streak yet."""
+    def days(n):
+        return f"{n} day" if n == 1 else f"{n} days"
+
+    if solved and current:
+        text = f"🔥 {current}-day streak! Your best is {days(longest)}."
+    elif current:
+        text = f"🔥 You're on a {current}-day streak, solve today to keep it going!"
+    elif longest:
+        text = f"Your best streak is {days(longest)}. Start a new one today!"
+    else:
+        return ""
+    return f'<p style="margin: -15px 0 30px 0; font-size: 15px; font-weight: 600; text-align: center;">{text}</p>'
+
+
+def build_html_email(username, title, difficulty, link, solved, quote=None, hints=None, streak_html=""):
+    """
+    Builds a responsive email with optional AI hints, quotes, and a live countdown GIF.
+    `streak_html` is the user's streak line, see format_streak().
+    """
     
     if hints is None:
         hints = []
@@ -186,7 +437,7 @@ def build_html_email(username, title, difficulty, link, solved, quote=None, hint
                                 <h1 style="margin: 0 0 20px 0; font-size: 3vh; font-weight: 600; color: #000; text-align: center;">{heading}</h1>
                                 <p style="margin: 0 0 30px 0; font-size: 16px; line-height: 1.6;">
                                     {subtext}
-                                </p>
+                                </p>{streak_html}
                                 <table border="0" cellpadding="0" cellspacing="0" width="100%">
                                     <tr>
                                         <td align="center">
@@ -217,6 +468,62 @@ def build_html_email(username, title, difficulty, link, solved, quote=None, hint
         </html>
             """
 
+# Placeholders rendered in place of the per-user values while compiling a template
+USERNAME_SLOT = "\x00username\x00"
+STREAK_SLOT = "\x00streak_html\x00"
+SLOT_PATTERN = re.compile("\x00(\\w+)\x00")
+
+
+class EmailTemplate:
+    """
+    One pre-rendered email variant, split around its per-user slots.
+    `slots` names the value that goes between each pair of `parts`
+    (all "username" when omitted).
+    Rendering is a join of the cached parts, so it costs nothing beyond the
+    size of the document.
+    """
+
+    def __init__(self, parts, slots=None):
+        self.parts = parts
+        self.slots = slots if slots is not None else ["username"] * (len(parts) - 1)
+
+    def render(self, username, **values):
+        """Returns the finished HTML for one user; missing values render empty."""
+        values["username"] = username
+        pieces = [self.parts[0]]
+        for slot, part in zip(self.slots, self.parts[1:]):
+            pieces.append(values.get(slot, ""))
+            pieces.append(part)
+        return "".join(pieces)
+
+
+def minify_html(html):
+    """
+    Drops blank lines and the indentation around every line of the email.
+    The result renders the same, because HTML collapses that whitespace anyway.
+    """
+    return "\n".join(line.strip() for line in html.splitlines() if line.strip())
+
+
+def compile_html_email(title, difficulty, link, solved, quote=None, hints=None, minify=None):
+    """
+    Renders the solved or unsolved email for today's question once, so each
+    user only costs a username substitution.
+    Without minify, template.render(username, streak_html=...) is
+    byte-identical to build_html_email(username, ..., streak_html=...) called
+    at compile time (the countdown deadline is frozen then).
+    """
+    if minify is None:
+        minify = config.EMAIL_MINIFY
+
+    with metrics.track("build_html_email"):
+        html = build_html_email(USERNAME_SLOT, title, difficulty, link, solved, quote=quote, hints=hints, streak_html=STREAK_SLOT)
+    if minify:
+        html = minify_html(html)
+    pieces = SLOT_PATTERN.split(html)
+    return EmailTemplate(pieces[0::2], pieces[1::2])
+
+
 def get_deadline_for_potd(hour=17, minute=0):
     """
     Returns a deadline in UTC ISO format (YYYY-MM-DDTHH:MM:SSZ) 
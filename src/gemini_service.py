@@ -1,30 +1,86 @@
 import requests
 import json
+import threading
+from concurrent.futures import Future
 from . import config
+from . import http_transport
+from . import storage
+from . import metrics
+from .leetcode_api import next_rollover
+from .log_sink import get_sink
 import time
 
 # --- Default Fallbacks ---
 DEFAULT_QUOTE = "Keep pushing! You’re closer than you think."
 DEFAULT_HINTS = ["Try to break the problem down into smaller pieces.", "Think about the data structures that might be useful here."]
 
-def call_gemini_api(prompt_text, expect_json=False):
+# --- Response Cache ---
+# Bump PROMPT_VERSION whenever a prompt changes so cached responses are regenerated
+PROMPT_VERSION = 1
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def cached_generate(key, expires_at, generate, should_cache=None):
+    """
+    Returns the cached response for key, or calls generate() to produce it.
+    Concurrent callers asking for the same key share a single in-flight call.
+    generate() returns None when it failed, and failures are not cached;
+    `should_cache` can veto caching other results too.
     """
-    A generic function to call the Gemini API using 'requests'.
+    # Keys look like gemini:<kind>:..., which also names the stage in the metrics
+    stage_name = f"gemini_{key.split(':')[1]}"
+    value = storage.cache_get(key)
+    metrics.record_cache(stage_name, hit=value is not None)
+    if value is not None:
+        return value
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = Future()
+            _inflight[key] = future
+
+    if not is_owner:
+        return future.result()
+
+    try:
+        with metrics.track(stage_name) as stage:
+            value = generate()
+            if value is None:
+                stage.fail()
+        if value is not None and (should_cache is None or should_cache(value)):
+            storage.cache_set(key, value, expires_at)
+        future.set_result(value)
+        return value
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+def call_gemini_api(prompt_text, expect_json=False, response_schema=None):
+    """
+    A generic function to call the Gemini API through the shared HTTP transport.
     This uses the gemini-2.5-flash model for speed and efficiency.
+    With expect_json the response is a JSON array of strings, unless a
+    different `response_schema` is given.
     """
     if not config.GEMINI_API_KEY:
-        print("GEMINI_API_KEY not set. Skipping Gemini call.")
+        get_sink().info("GEMINI_API_KEY not set. Skipping Gemini call.")
         return None
 
-    api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-09-2025:generateContent?key={config.GEMINI_API_KEY}"
+    api_url = f"{config.GEMINI_API_URL}?key={config.GEMINI_API_KEY}"
 
     gen_config = {
         "temperature": 0.7 
     }
 
-    if expect_json:
+    if expect_json or response_schema:
         gen_config["responseMimeType"] = "application/json"
-        gen_config["responseSchema"] = {
+        gen_config["responseSchema"] = response_schema or {
             "type": "ARRAY",
             "items": { "type": "STRING" }
         }
@@ -36,86 +92,132 @@ def call_gemini_api(prompt_text, expect_json=False):
     
 
     try:
-        response = requests.post(api_url, json=payload, headers={'Content-Type': 'application/json'})
+        response = http_transport.post(api_url, json=payload, headers={'Content-Type': 'application/json'})
         response.raise_for_status() # Raise an error for bad responses
         
         result = response.json()
         text = result.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '')
         
         if not text:
-            print(" Gemini API returned an empty response.")
+            get_sink().error(" Gemini API returned an empty response.")
             return None
         
         return text
         
     except requests.exceptions.RequestException as e:
-        print(f" Error calling Gemini API: {e}")
+        get_sink().error(f" Error calling Gemini API: {e}")
         return None
     except (KeyError, IndexError):
-        print(" Error parsing Gemini response: Malformed or unexpected structure.")
+        get_sink().error(" Error parsing Gemini response: Malformed or unexpected structure.")
         return None
 
-def get_motivational_quote():
+# Every outcome of core_logic.get_hint_count, generated together in one call
+HINT_COUNTS = (1, 2, 3, 4)
+
+DAILY_CONTENT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "quote": {"type": "STRING"},
+        "hints_by_count": {
+            "type": "OBJECT",
+            "properties": {str(n): {"type": "ARRAY", "items": {"type": "STRING"}} for n in HINT_COUNTS},
+            "required": [str(n) for n in HINT_COUNTS],
+        },
+    },
+    "required": ["quote", "hints_by_count"],
+}
+
+def get_daily_content(question, date):
     """
-    Calls Gemini to get a motivational quote from a famous movie.
+    Returns {"quote": str, "hints_by_count": {1: [...], ..., 4: [...]}} for
+    the daily question dated `date`, from a single Gemini call that is cached
+    until the rollover. Fields Gemini got wrong fall back to DEFAULT_QUOTE
+    and DEFAULT_HINTS individually (and are retried on the next run).
     """
-    #adding salt to prevent server side caching of api response
-    current_time_salt = time.time()
+    key = f"gemini:daily:v{PROMPT_VERSION}:{date}:{question.get('titleSlug', question['title'])}"
+    content = cached_generate(
+        key,
+        next_rollover(date),
+        lambda: request_daily_content(question),
+        should_cache=lambda value: value["quote"] is not None and all(value["hints_by_count"].values()),
+    ) or {"quote": None, "hints_by_count": {}}
 
-    prompt = """Give me one, and only one, inspiring motivational quote from a famous movie. Include the movie title and who said it in the follwing manner.
-    eg:
-    There is a difference between knowing the path and walking the path.
-    - Morpheus (The Matrix).
-    The format should match 100%.
-    Make sure it's fresh and not overused. The quote should be concise, impactful, and suitable for encouraging someone to keep going with their coding practice.
-    Add a touch of creativity to make it stand out!
-    Use the following unique salt to ensure variety: {current_time_salt}
+    hints_by_count = content["hints_by_count"]
+    return {
+        "quote": content["quote"] or DEFAULT_QUOTE,
+        "hints_by_count": {
+            n: hints_by_count.get(str(n)) or DEFAULT_HINTS[:n] for n in HINT_COUNTS
+        },
+    }
+
+def parse_daily_content(response_text):
     """
-    
-    quote = call_gemini_api(prompt)
-    
-    if quote:
-        return quote.strip().strip('"')
-    else:
-        return DEFAULT_QUOTE
+    Validates a combined response field by field.
+    Returns {"quote": str or None, "hints_by_count": {"1": list or None, ...}}.
+    """
+    try:
+        data = json.loads(response_text)
+    except (json.JSONDecodeError, TypeError):
+        get_sink().error(" Failed to decode Gemini's JSON daily content response.")
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
 
-def generate_optimal_hints(question, hint_count):
+    quote = data.get("quote")
+    quote = quote.strip().strip('"') if isinstance(quote, str) and quote.strip() else None
+    if quote is None:
+        get_sink().error(" Gemini did not return a valid quote.")
+
+    raw_hints = data.get("hints_by_count")
+    raw_hints = raw_hints if isinstance(raw_hints, dict) else {}
+    hints_by_count = {}
+    for n in HINT_COUNTS:
+        hints = raw_hints.get(str(n))
+        if isinstance(hints, list):
+            hints = [h.strip() for h in hints if isinstance(h, str) and h.strip()][:n]
+        hints_by_count[str(n)] = hints or None
+        if not hints:
+            get_sink().error(f" Gemini did not return a valid list of {n} hints.")
+
+    return {"quote": quote, "hints_by_count": hints_by_count}
+
+def request_daily_content(question):
     """
-    Uses Gemini to generate new, optimal hints based on LeetCode's data.
+    Asks Gemini for the quote and every hint count in one structured call.
+    Returns the parsed content, or None if the call failed.
     """
-    
     title = question['title']
     difficulty = question['difficulty']
     tags = ", ".join([tag['name'] for tag in question.get('topicTags', [])])
     original_hints = "\n".join([f"- {h}" for h in question.get('hints', [])])
 
     prompt = f"""
-    You are an expert LeetCode & Data structures coach. A user is stuck on the following problem:
+    You are an expert LeetCode & Data structures coach who loves movies. Produce two things.
+
+    1. "quote": one, and only one, inspiring motivational quote from a famous movie. Include the movie title and who said it in the following manner.
+    eg:
+    There is a difference between knowing the path and walking the path.
+    - Morpheus (The Matrix).
+    The format should match 100%.
+    Make sure it's fresh and not overused. The quote should be concise, impactful, and suitable for encouraging someone to keep going with their coding practice.
+    Use the following unique salt to ensure variety: {time.time()}
+
+    2. "hints_by_count": a user is stuck on the following problem:
     - Problem: "{title}"
     - Difficulty: {difficulty}
     - Topic Tags: {tags}
-    
+
     The original, cryptic hints provided by LeetCode are:
     {original_hints}
-    
-    Please generate exactly {hint_count} new, short, and intuitive hints to help the user.
+
+    Write four independent sets of new, short, and intuitive hints, under the keys "1", "2", "3" and "4",
+    containing exactly 1, 2, 3 and 4 hints respectively. Each set must stand on its own.
     These new hints should be more helpful than the originals. Guide them towards the right data structure or algorithm without giving away the full solution.
-    
-    Return your {hint_count} hints as a JSON array of strings.
+
+    Return a JSON object with the fields "quote" and "hints_by_count".
     """
-    
-    # We expect a JSON response (an array of strings)
-    response_text = call_gemini_api(prompt, expect_json=True)
-    
-    if response_text:
-        try:
-            hints = json.loads(response_text)
-            if isinstance(hints, list) and len(hints) > 0:
-                return hints
-            else:
-                print(" Gemini did not return a valid list of hints.")
-        except json.JSONDecodeError:
-            print(" Failed to decode Gemini's JSON hint response.")
-    
-    # Fallback if anything fails
-    return DEFAULT_HINTS[:hint_count]
+
+    response_text = call_gemini_api(prompt, response_schema=DAILY_CONTENT_SCHEMA)
+    if not response_text:
+        return None
+    return parse_daily_content(response_text)
@@ -0,0 +1,129 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from . import config
+from . import metrics
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_sessions = {}
+_stats = {}
+_lock = threading.Lock()
+
+def _host(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+def get_session(url, pool=None):
+    """
+    Returns the keep-alive Session shared by every request to url's host or,
+    with `pool`, by every request of that pool whatever its host. A pool keeps
+    connections to its HTTP_POOL_SIZE most recently used hosts only, so
+    user-supplied URLs cannot pile up sessions.
+    """
+    key = pool or _host(url)
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=config.HTTP_POOL_SIZE if pool else 1, pool_maxsize=config.HTTP_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[key] = session
+        return session
+
+def _record(host, seconds, ok, retried):
+    with _lock:
+        stats = _stats.setdefault(host, {
+            "requests": 0, "errors": 0, "retries": 0, "total_seconds": 0.0, "max_seconds": 0.0,
+        })
+        stats["requests"] += 1
+        stats["errors"] += 0 if ok else 1
+        stats["retries"] += 1 if retried else 0
+        stats["total_seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+def latency_stats():
+    """Returns a snapshot of the per-host request counters and latencies (seconds)."""
+    with _lock:
+        snapshot = {host: dict(stats) for host, stats in _stats.items()}
+    for stats in snapshot.values():
+        stats["avg_seconds"] = stats["total_seconds"] / stats["requests"] if stats["requests"] else 0.0
+    return snapshot
+
+def prometheus_lines():
+    """Renders the per-host counters for the metrics endpoint."""
+    stats = latency_stats()
+    lines = []
+    for name, field, kind, help_text in (
+        ("leetbot_http_requests_total", "requests", "counter", "HTTP attempts per host."),
+        ("leetbot_http_errors_total", "errors", "counter", "HTTP attempts that failed or were throttled, per host."),
+        ("leetbot_http_retries_total", "retries", "counter", "HTTP attempts that were retries, per host."),
+        ("leetbot_http_request_seconds_total", "total_seconds", "counter", "Time spent in HTTP attempts per host."),
+        ("leetbot_http_request_seconds_max", "max_seconds", "gauge", "Slowest HTTP attempt per host."),
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        lines += [f'{name}{metrics.format_labels(host=host)} {host_stats[field]}' for host, host_stats in sorted(stats.items())]
+    return lines
+
+metrics.register_collector(prometheus_lines)
+
+def reset_stats():
+    """Clears the per-host counters."""
+    with _lock:
+        _stats.clear()
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff, honouring a numeric Retry-After header when present."""
+    if retry_after:
+        try:
+            return min(float(retry_after), config.HTTP_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(config.HTTP_BACKOFF_MAX, config.HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+def post(url, retries=None, timeout=None, on_attempt=None, pool=None, **kwargs):
+    """
+    POSTs through the pooled session for url's host (or for `pool`, which
+    also names it in the metrics instead of the host) with connect/read timeouts.
+    Connection errors, timeouts and 429/5xx responses are retried with jittered
+    exponential backoff; the last response is returned (or the last error raised)
+    once `retries` are used up.
+    `on_attempt(status, seconds)` is called after every attempt, with status
+    None when no response came back, e.g. to feed a concurrency limiter.
+    """
+    host = pool or _host(url)
+    session = get_session(url, pool)
+    if retries is None:
+        retries = config.HTTP_MAX_RETRIES
+    if timeout is None:
+        timeout = (config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT)
+
+    for attempt in range(retries + 1):
+        start = time.perf_counter()
+        try:
+            response = session.post(url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            elapsed = time.perf_counter() - start
+            _record(host, elapsed, ok=False, retried=attempt > 0)
+            if on_attempt:
+                on_attempt(None, elapsed)
+            if attempt == retries:
+                raise
+            retry_after = None
+        else:
+            elapsed = time.perf_counter() - start
+            ok = response.status_code not in RETRY_STATUSES
+            _record(host, elapsed, ok=ok, retried=attempt > 0)
+            if on_attempt:
+                on_attempt(response.status_code, elapsed)
+            if ok or attempt == retries:
+                return response
+            retry_after = response.headers.get("Retry-After")
+            response.close()
+
+        time.sleep(backoff_delay(attempt, retry_after))
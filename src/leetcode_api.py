@@ -1,57 +1,208 @@
-import requests
 from . import config
-from cachetools import TTLCache, cached
-from apscheduler.schedulers.background import BackgroundScheduler
-from pytz import timezone
+from . import http_transport
+from . import storage
+from . import metrics
+from .log_sink import get_sink
+import threading
 import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
-cache = TTLCache(maxsize=1, ttl=24*60*15)
+def next_rollover(date):
+    """Returns the epoch time at which the daily question dated `date` (YYYY-MM-DD) is replaced."""
+    day = datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return (day + timedelta(days=1)).timestamp()
 
 def get_daily_question():
     """Fetches the title and link of the daily LeetCode question"""
-    try:
-        cached_result = cache.get('daily_question')
-        if cached_result:
-            print("Fetched daily question from cache.")
-            return cached_result
+    with metrics.track("daily_question") as stage:
+        try:
+            # LeetCode rolls the daily question over at midnight UTC
+            today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+            cached_result = storage.cache_get(f'daily_question:{today}')
+            metrics.record_cache("daily_question", hit=bool(cached_result))
+            if cached_result:
+                get_sink().info("Fetched daily question from cache.")
+                return cached_result
         
-        response = requests.post(
-            config.LEETCODE_API_URL, 
-            json={'query': config.QUERY_DAILY_QUESTION}
-        )
-        response.raise_for_status()
-        q_data = response.json()["data"]["activeDailyCodingChallengeQuestion"]
-        q_data['fullLink'] = "https://leetcode.com" + q_data['link']
-
-        cache['daily_question'] = q_data
-        return q_data
-
-    except Exception as e:
-        print(f"\n Error fetching daily question: {e}")
-        return None
-
-def get_recent_submissions(username):
-    """Fetches the 50 most recent accepted submissions for a user"""
-    try:
-        variables = {"username": username, "limit": 50}
-        response = requests.post(
-            config.LEETCODE_API_URL,
-            json={'query': config.QUERY_RECENT_SUBMISSIONS, 'variables': variables}
-        )
-        response.raise_for_status()
-        return response.json()["data"]["recentAcSubmissionList"]
-    except Exception as e:
-        print(f"\n Error fetching submissions for {username}: {e}")
-        return []
-
-def evict_cache():
-    """Evicts all cached data"""
-    cache.expire() 
-    print("Cache eviction run at:", time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()))
-
-def setup_cache_eviction():
-    """Sets up the cache eviction scheduler to run at 5:00 AM PST"""
-    scheduler = BackgroundScheduler(timezone=timezone('US/Pacific'))
-    scheduler.add_job(evict_cache, 'cron', hour=5, minute=0)
-    scheduler.start()
-    return scheduler
\ No newline at end of file
+            response = http_transport.post(
+                config.LEETCODE_API_URL, 
+                json={'query': config.QUERY_DAILY_QUESTION}
+            )
+            response.raise_for_status()
+            q_data = response.json()["data"]["activeDailyCodingChallengeQuestion"]
+            q_data['fullLink'] = "https://leetcode.com" + q_data['link']
+
+            # Keyed by the challenge's own date, so a question served late after
+            # the rollover expires straight away instead of being cached for a day
+            storage.cache_set(f"daily_question:{q_data['date']}", q_data, next_rollover(q_data['date']))
+            return q_data
+
+        except Exception as e:
+            get_sink().error(f"\n Error fetching daily question: {e}")
+            stage.fail()
+            return None
+
+# LeetCode's default page of recent accepted submissions
+MAX_SUBMISSION_LIMIT = 50
+
+CONCURRENCY_LIMIT = metrics.Gauge("leetbot_leetcode_concurrency_limit", "Current AIMD limit on LeetCode requests in flight.")
+CONCURRENCY_CHANGES = metrics.Counter("leetbot_leetcode_concurrency_changes_total", "AIMD limit changes by direction.", ["direction"])
+
+
+class ConcurrencyLimiter:
+    """
+    Additive-increase/multiplicative-decrease limit on requests in flight.
+    Every fast, successful attempt adds 1/limit (one step per round of
+    requests); a 429, 5xx, timeout or response slower than the latency
+    target halves the limit, at most once per round trip so a burst of
+    failures from the same moment only counts once.
+    """
+
+    def __init__(self, initial=None, ceiling=None, latency_target=None, floor=1):
+        self.limit = float(initial or config.LEETCODE_MAX_CONCURRENCY)
+        self.ceiling = ceiling or config.LEETCODE_CONCURRENCY_CEILING
+        self.latency_target = latency_target or config.LEETCODE_LATENCY_TARGET
+        self.floor = floor
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        CONCURRENCY_LIMIT.set(self.limit)
+
+    @contextmanager
+    def slot(self):
+        """Waits until fewer than `limit` requests are in flight, and holds a place meanwhile."""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def observe(self, status, seconds):
+        """Adjusts the limit after one attempt (the http_transport.post on_attempt hook)."""
+        congested = status is None or status in http_transport.RETRY_STATUSES or seconds > self.latency_target
+        now = time.monotonic()
+        with self._cond:
+            if congested:
+                # Only attempts that started after the last cut may cut again
+                if now - seconds < self._last_decrease:
+                    return
+                self.limit = max(self.floor, self.limit / 2)
+                self._last_decrease = now
+                CONCURRENCY_CHANGES.inc(direction="decrease")
+            else:
+                self.limit = min(self.ceiling, self.limit + 1 / self.limit)
+                CONCURRENCY_CHANGES.inc(direction="increase")
+            CONCURRENCY_LIMIT.set(round(self.limit, 2))
+            self._cond.notify_all()
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_limiter():
+    """Returns the limiter shared by every LeetCode submissions request in the process."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = ConcurrencyLimiter()
+        return _limiter
+
+def _post_limited(payload):
+    limiter = get_limiter()
+    with limiter.slot():
+        response = http_transport.post(config.LEETCODE_API_URL, json=payload, on_attempt=limiter.observe)
+    response.raise_for_status()
+    return response.json()
+
+def get_recent_submissions(username, limit=MAX_SUBMISSION_LIMIT):
+    """
+    Fetches the `limit` most recent accepted submissions for a user.
+    Returns None when they could not be fetched (throttled, timed out, ...),
+    which means "unknown", not "no submissions".
+    """
+    with metrics.track("fetch_submissions") as stage:
+        try:
+            variables = {"username": username, "limit": limit}
+            body = _post_limited({'query': config.QUERY_RECENT_SUBMISSIONS, 'variables': variables})
+            return body["data"]["recentAcSubmissionList"]
+        except Exception as e:
+            get_sink().error(f"\n Error fetching submissions for {username}: {e}")
+            stage.fail()
+            return None
+
+@lru_cache(maxsize=None)
+def build_batch_query(count):
+    """Builds a GraphQL query that fetches recentAcSubmissionList for `count` aliased users."""
+    params = "".join(f", $u{i}: String!" for i in range(count))
+    fields = "".join(config.QUERY_RECENT_SUBMISSIONS_ALIAS.format(index=i) for i in range(count))
+    return f"query recentAcSubmissionsBatch($limit: Int!{params}) {{{fields}\n}}\n"
+
+def get_recent_submissions_batch(usernames, limit=MAX_SUBMISSION_LIMIT):
+    """
+    Fetches the recent submissions of several users with one aliased GraphQL request.
+    Users whose alias errors fall back to a single-user query, so each result
+    matches get_recent_submissions. When the whole request fails every user is
+    None (unknown): retrying them one by one would only add load to a server
+    that is already throttling.
+    """
+    usernames = list(usernames)
+    if len(usernames) == 1:
+        return {usernames[0]: get_recent_submissions(usernames[0], limit)}
+
+    results = {}
+    with metrics.track("fetch_submissions_batch") as stage:
+        try:
+            variables = {"limit": limit}
+            variables.update({f"u{i}": username for i, username in enumerate(usernames)})
+            body = _post_limited({'query': build_batch_query(len(usernames)), 'variables': variables})
+            data = body.get("data") or {}
+            failed_aliases = {
+                error["path"][0] for error in body.get("errors") or [] if error.get("path")
+            }
+            for i, username in enumerate(usernames):
+                alias = f"u{i}"
+                if alias not in failed_aliases and isinstance(data.get(alias), list):
+                    results[username] = data[alias]
+        except Exception as e:
+            get_sink().error(f"\n Error fetching batched submissions for {len(usernames)} users: {e}")
+            stage.fail()
+            return dict.fromkeys(usernames)
+
+    for username in usernames:
+        if username not in results:
+            results[username] = get_recent_submissions(username, limit)
+    return results
+
+def get_recent_submissions_many(usernames, max_concurrency=None, batch_size=None, limit=MAX_SUBMISSION_LIMIT):
+    """
+    Fetches the recent submissions of many users in parallel, `batch_size`
+    users per GraphQL request. How many requests are in flight at once is
+    up to the shared ConcurrencyLimiter; `max_concurrency` only caps it.
+    Returns a dict mapping each username to the same list get_recent_submissions
+    would return for it (None if that user's fetch failed).
+    """
+    usernames = list(dict.fromkeys(usernames))
+    if not usernames:
+        return {}
+
+    if max_concurrency is None:
+        max_concurrency = config.LEETCODE_CONCURRENCY_CEILING
+    if batch_size is None:
+        batch_size = config.LEETCODE_BATCH_SIZE
+    batch_size = max(1, batch_size)
+    batches = [usernames[i:i + batch_size] for i in range(0, len(usernames), batch_size)]
+    workers = max(1, min(max_concurrency, len(batches)))
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="leetcode-fetch") as pool:
+        for batch_result in pool.map(lambda batch: get_recent_submissions_batch(batch, limit), batches):
+            results.update(batch_result)
+    return results
@@ -0,0 +1,111 @@
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from . import config
+
+
+class _StageHandle:
+    """Lets a stage report its outcome, like Halo's succeed()/fail()."""
+
+    def __init__(self):
+        self.status = "ok"
+        self.message = None
+
+    def succeed(self, message=None):
+        self.status, self.message = "ok", message
+
+    def fail(self, message=None):
+        self.status, self.message = "failed", message
+
+
+class SpinnerSink:
+    """Terminal output: a Halo spinner per stage, plus plain console lines."""
+
+    def console(self, text):
+        print(text)
+
+    def info(self, message, **fields):
+        print(message)
+
+    def error(self, message, **fields):
+        print(message)
+
+    @contextmanager
+    def stage(self, name, text, spinner='dots', color='cyan', **fields):
+        from halo import Halo
+        handle = _StageHandle()
+        with Halo(text=text, spinner=spinner, color=color) as halo:
+            try:
+                yield handle
+            except BaseException as e:
+                halo.fail(f"{text} {e}")
+                raise
+            if handle.status == "ok":
+                halo.succeed(handle.message or text)
+            else:
+                halo.fail(handle.message or text)
+
+
+class JsonLinesSink:
+    """One JSON object per line: a record per stage (with its duration) and per info message."""
+
+    def __init__(self, stream=None):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def _emit(self, record):
+        line = json.dumps(record, default=str, ensure_ascii=False)
+        with self._lock:
+            stream = self.stream or sys.stdout
+            stream.write(line + "\n")
+            stream.flush()
+
+    def console(self, text):
+        pass
+
+    def info(self, message, **fields):
+        self._emit({"ts": datetime.now(timezone.utc).isoformat(), "level": "info", "message": message.strip(), **fields})
+
+    def error(self, message, **fields):
+        self._emit({"ts": datetime.now(timezone.utc).isoformat(), "level": "error", "message": message.strip(), **fields})
+
+    @contextmanager
+    def stage(self, name, text, spinner=None, color=None, **fields):
+        handle = _StageHandle()
+        start = time.perf_counter()
+        try:
+            yield handle
+        except BaseException as e:
+            handle.fail(str(e))
+            raise
+        finally:
+            record = {
+                "ts": datetime.now(timezone.utc).isoformat(),
+                "level": "info" if handle.status == "ok" else "error",
+                "stage": name,
+                "status": handle.status,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+                **fields,
+            }
+            if handle.message:
+                record["message"] = handle.message
+            self._emit(record)
+
+
+_sink = None
+
+def get_sink():
+    """
+    Returns the process-wide sink: spinners when LOG_FORMAT is "spinner", or
+    "auto" on a terminal; JSON lines otherwise.
+    """
+    global _sink
+    if _sink is None:
+        log_format = config.LOG_FORMAT
+        if log_format == "auto":
+            log_format = "spinner" if sys.stdout.isatty() else "json"
+        _sink = SpinnerSink() if log_format == "spinner" else JsonLinesSink()
+    return _sink
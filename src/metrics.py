@@ -0,0 +1,201 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from . import config
+from .log_sink import get_sink
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_metrics = []
+_collectors = []
+_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+def format_labels(**labels):
+    """Renders labels as {name="value",...} for collectors, escaped like every other metric."""
+    return _format_labels(list(labels.items()))
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _lock:
+            _metrics.append(self)
+
+    def _key(self, labels):
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """A monotonically increasing count per label set."""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(Counter):
+    """A value that can go up and down per label set."""
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative latency buckets per label set."""
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = self.header()
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+def register_collector(collect):
+    """Registers a callable returning exposition lines that are computed at scrape time."""
+    with _lock:
+        _collectors.append(collect)
+
+def render():
+    """Returns every metric in the Prometheus text exposition format."""
+    with _lock:
+        metrics, collectors = list(_metrics), list(_collectors)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    for collect in collectors:
+        lines.extend(collect())
+    return "\n".join(lines) + "\n"
+
+
+# --- Bot metrics ---
+STAGE_SECONDS = Histogram("leetbot_stage_duration_seconds", "Time spent in each stage of a run.", ["stage"])
+STAGE_TOTAL = Counter("leetbot_stage_total", "Stage executions by outcome.", ["stage", "outcome"])
+CACHE_LOOKUPS = Counter("leetbot_cache_lookups_total", "Cache lookups by result.", ["cache", "result"])
+CACHE_HIT_RATIO = Gauge("leetbot_cache_hit_ratio", "Share of cache lookups that were hits.", ["cache"])
+
+
+class _Stage:
+    def __init__(self):
+        self.failed = False
+
+    def fail(self):
+        """Marks the stage failed without raising (for callers that swallow errors)."""
+        self.failed = True
+
+@contextmanager
+def track(stage):
+    """Times a stage and counts it as a success, or a failure if it raised or called fail()."""
+    handle = _Stage()
+    start = time.perf_counter()
+    try:
+        yield handle
+    except BaseException:
+        handle.failed = True
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+        STAGE_TOTAL.inc(stage=stage, outcome="failure" if handle.failed else "success")
+
+def timed(stage):
+    """Decorator form of track() for whole functions."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with track(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_cache(cache, hit):
+    """Counts a cache lookup and updates that cache's hit ratio."""
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+    hits = CACHE_LOOKUPS.value(cache=cache, result="hit")
+    misses = CACHE_LOOKUPS.value(cache=cache, result="miss")
+    CACHE_HIT_RATIO.set(hits / (hits + misses), cache=cache)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_server(port=None, host=None):
+    """Serves /metrics from a daemon thread. Returns the server, or None when METRICS_PORT is 0."""
+    port = config.METRICS_PORT if port is None else port
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host or config.METRICS_HOST, port), _MetricsHandler)
+    except OSError as e:
+        get_sink().error(f" Could not start the metrics endpoint on port {port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    get_sink().info(f"Serving metrics at http://{host or config.METRICS_HOST}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,189 @@
+import abc
+import html
+from . import config
+from . import http_transport
+from .log_sink import get_sink
+
+# Characters a Telegram message holds
+TELEGRAM_MAX_TEXT = 4096
+
+
+def build_payload(title, difficulty, link, solved, quote, hints):
+    """The reminder shared by every notification of one run variant."""
+    return {
+        "title": title,
+        "difficulty": difficulty,
+        "link": link,
+        "solved": solved,
+        "quote": quote,
+        "hints": list(hints),
+    }
+
+def headline(notification):
+    """One line saying whether the user solved today's question."""
+    if notification["solved"]:
+        return f"✅ {notification['username']} solved today's LeetCode problem: {notification['title']} ({notification['difficulty']})"
+    return f"⏳ {notification['username']}, today's LeetCode problem is still waiting: {notification['title']} ({notification['difficulty']})"
+
+def streak_line(notification):
+    current, longest = notification.get("current_streak", 0), notification.get("longest_streak", 0)
+    if not current:
+        return ""
+    line = f"🔥 {current}-day streak"
+    return line + f" (best: {longest})" if longest > current else line
+
+def escape_within(text, limit):
+    """HTML-escapes the longest start of `text` whose escaped form fits in `limit` characters."""
+    parts = []
+    length = 0
+    for char in text:
+        part = html.escape(char)
+        if length + len(part) > limit:
+            break
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)
+
+def format_text(notification):
+    """The notification as plain text for chat channels."""
+    lines = [headline(notification), notification["link"]]
+    streak = streak_line(notification)
+    if streak:
+        lines.append(streak)
+    if notification["hints"]:
+        lines.append("Hints:")
+        lines += [f"{i}. {hint}" for i, hint in enumerate(notification["hints"], 1)]
+    if notification["quote"]:
+        lines.append(f"“{notification['quote']}”")
+    return "\n".join(lines)
+
+
+class Channel(abc.ABC):
+    """
+    Delivers notifications of one `kind` to addresses of that kind.
+    Notifications for the same address are combined into one request of up
+    to `max_bulk` of them where the service allows it.
+    """
+    kind = ""
+    max_bulk = 1
+    # http_transport pool for channels whose URLs come from users, so each host gets no session or metrics of its own
+    pool = None
+
+    def bulk_size(self):
+        return max(1, min(self.max_bulk, config.NOTIFY_BATCH_SIZE))
+
+    @abc.abstractmethod
+    def request(self, address, notifications):
+        """Returns (url, JSON body) of the request delivering `notifications` to `address`."""
+
+    def send(self, address, notifications):
+        """Sends the notifications in one request. Returns True on success, False otherwise."""
+        try:
+            url, body = self.request(address, notifications)
+            # The outbox retries failed notifications with backoff, so one slow or
+            # throttled endpoint does not hold the channel up with in-place retries
+            response = http_transport.post(
+                url, json=body, retries=0, timeout=(config.HTTP_CONNECT_TIMEOUT, config.NOTIFY_TIMEOUT), pool=self.pool
+            )
+            if response.status_code >= 300:
+                get_sink().error(f"\n {self.kind} notification failed with HTTP {response.status_code}: {response.text[:200]}")
+                return False
+            return True
+        except Exception as e:
+            # Only the error type: the message may quote the URL, which holds the bot token for Telegram
+            get_sink().error(f"\n Failed to send {self.kind} notification: {type(e).__name__}")
+            return False
+
+
+class WebhookChannel(Channel):
+    """POSTs {"notifications": [payload, ...]} as JSON to the user's own URL."""
+    kind = "webhook"
+    max_bulk = 1000
+    pool = "webhook"
+
+    def request(self, address, notifications):
+        return address, {"notifications": notifications}
+
+
+class SlackChannel(Channel):
+    """Slack incoming webhook; notifications to the same webhook share one message."""
+    kind = "slack"
+    # Slack allows 50 blocks per message, and each notification takes two
+    max_bulk = 25
+
+    def request(self, address, notifications):
+        blocks = []
+        for notification in notifications:
+            blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": format_text(notification)}})
+            blocks.append({"type": "divider"})
+        return address, {"text": headline(notifications[0]), "blocks": blocks[:-1]}
+
+
+class DiscordChannel(Channel):
+    """Discord webhook; notifications to the same webhook are embeds of one message."""
+    kind = "discord"
+    # Discord allows 10 embeds per message
+    max_bulk = 10
+
+    def request(self, address, notifications):
+        embeds = [{
+            "title": headline(notification)[:256],
+            "url": notification["link"],
+            "description": format_text(notification)[:4096],
+            "color": 0x2ECC71 if notification["solved"] else 0xF1C40F,
+        } for notification in notifications]
+        return address, {"embeds": embeds}
+
+
+class TelegramChannel(Channel):
+    """Telegram bot message to a chat id; notifications to the same chat share one message."""
+    kind = "telegram"
+    # Telegram messages hold TELEGRAM_MAX_TEXT characters
+    max_bulk = 5
+
+    def request(self, address, notifications):
+        if not config.TELEGRAM_BOT_TOKEN:
+            raise ValueError("TELEGRAM_BOT_TOKEN is not set")
+        # Cut the plain text, so the limit never splits an escaped entity such as &amp;
+        separator = "\n\n"
+        budget = (TELEGRAM_MAX_TEXT - len(separator) * (len(notifications) - 1)) // len(notifications)
+        text = separator.join(escape_within(format_text(notification), budget) for notification in notifications)
+        url = f"{config.TELEGRAM_API_URL}/bot{config.TELEGRAM_BOT_TOKEN}/sendMessage"
+        return url, {"chat_id": address, "text": text, "parse_mode": "HTML", "disable_web_page_preview": True}
+
+
+CHANNELS = {channel.kind: channel for channel in (WebhookChannel(), SlackChannel(), DiscordChannel(), TelegramChannel())}
+# The key of each kind's address in a user's "channels" entry
+ADDRESS_FIELDS = {"webhook": "url", "slack": "url", "discord": "url", "telegram": "chat_id"}
+
+
+def is_email(recipient):
+    """True for an outbox recipient that is an email address rather than a channel address."""
+    return ":" not in recipient
+
+def split_recipient(recipient):
+    """Returns (kind, address) of a channel recipient such as "slack:https://hooks.slack.com/..."."""
+    kind, _, address = recipient.partition(":")
+    return kind, address
+
+def recipients(user):
+    """
+    Where to deliver `user`'s reminders, as outbox recipients: email
+    addresses as they are, other channels as "<kind>:<address>".
+    Users without "channels" get email only; users with "channels" get
+    exactly those, with {"type": "email"} standing for their emails.
+    """
+    channels = user.get("channels")
+    if not channels:
+        return list(user["emails"])
+
+    found = []
+    for channel in channels:
+        kind = channel.get("type") if isinstance(channel, dict) else None
+        if kind == "email":
+            found += user["emails"]
+        elif kind in CHANNELS and channel.get(ADDRESS_FIELDS[kind]):
+            found.append(f"{kind}:{channel[ADDRESS_FIELDS[kind]]}")
+        else:
+            get_sink().error(f" Invalid notification channel {channel!r} for user {user.get('username')}, skipping it.")
+    return list(dict.fromkeys(found))
@@ -0,0 +1,549 @@
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from . import config
+from . import email_service
+from . import metrics
+from . import notifier
+from . import sharding
+from . import storage
+from .log_sink import get_sink
+
+# Compiled email variants, stored once per run instead of once per message
+storage.register_schema("""
+CREATE TABLE IF NOT EXISTS outbox_templates (
+    template_id TEXT PRIMARY KEY,
+    subject TEXT NOT NULL,
+    parts TEXT NOT NULL,
+    slots TEXT NOT NULL
+);
+""")
+
+# What every chat/webhook notification of a run variant shares (title, link, hints, ...)
+storage.register_schema("""
+CREATE TABLE IF NOT EXISTS outbox_payloads (
+    template_id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL
+);
+""")
+
+# One row per (run, user, address); an address is an email, or "<channel>:<address>" for
+# chat and webhook notifications (see notifier.recipients). The primary key is the idempotency key, so a
+# restarted run or a second replica can never queue the same mail twice
+storage.register_schema("""
+CREATE TABLE IF NOT EXISTS outbox (
+    run_key TEXT NOT NULL,
+    username TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    template_id TEXT NOT NULL,
+    slot_values TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    claimed_by TEXT,
+    claimed_until REAL NOT NULL DEFAULT 0,
+    sent_at REAL,
+    PRIMARY KEY (run_key, username, recipient)
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS outbox_sent ON outbox (sent_at);
+""")
+
+# Every message sent, by sender account, for each account's rolling daily quota
+storage.register_schema("""
+CREATE TABLE IF NOT EXISTS outbox_sends (
+    account TEXT NOT NULL,
+    sent_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_sends_account ON outbox_sends (account, sent_at);
+""")
+
+# Messages claimed from the outbox per transaction while draining
+CLAIM_BATCH = 50
+DAY_SECONDS = 24 * 60 * 60
+
+
+class TokenBucket:
+    """Allows `rate` events per `period` seconds on average, in bursts of up to `rate`."""
+
+    def __init__(self, rate, period):
+        self.capacity = float(rate)
+        self.fill_rate = rate / period
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_take(self):
+        """Takes one token if there is one. Returns 0, or the seconds until one is available."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.fill_rate
+
+    def take(self):
+        """Takes one token, sleeping until one is available."""
+        while True:
+            wait = self.try_take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+# Per sender account, shared by every drain in the process
+_buckets = {}
+_blocked_until = {}
+_in_flight = {}
+_sender_lock = threading.Lock()
+
+# The background drainer thread of each channel kind
+_drainers = {}
+_drainers_lock = threading.Lock()
+
+def _bucket(account):
+    """The account's per-minute token bucket, or None if it has no per-minute limit."""
+    if not account.per_minute:
+        return None
+    with _sender_lock:
+        bucket = _buckets.get(account.name)
+        if bucket is None or bucket.capacity != account.per_minute:
+            bucket = _buckets[account.name] = TokenBucket(account.per_minute, 60)
+        return bucket
+
+def block_sender(account, reason):
+    """Skips `account` for SMTP_ACCOUNT_COOLDOWN seconds, e.g. after it hit a sending limit."""
+    with _sender_lock:
+        _blocked_until[account.name] = time.time() + config.SMTP_ACCOUNT_COOLDOWN
+    get_sink().info(
+        f" Sender {account.name} cannot send: {reason}. Using the other accounts for {config.SMTP_ACCOUNT_COOLDOWN:.0f}s.",
+        stage="send_email", account=account.name
+    )
+
+def _daily_left(account, used):
+    """Messages `account` may still send in the rolling day, or None if it has no daily limit."""
+    if not account.per_day:
+        return None
+    return max(0, account.per_day - used.get(account.name, 0))
+
+def _sent_last_day(conn, now):
+    return dict(conn.execute(
+        "SELECT account, COUNT(*) FROM outbox_sends WHERE sent_at > ? GROUP BY account", (now - DAY_SECONDS,)
+    ).fetchall())
+
+def _pick_sender(accounts, used):
+    """
+    Waits until a sender account has room in its per-minute limit and
+    returns it, preferring accounts with fewer messages in flight and more of
+    their daily quota left, so mail is spread evenly over all of them.
+    Returns None when no account can send (daily quotas used up, or every
+    account cooling down after a failure). Pair with _release_sender.
+    """
+    while True:
+        now = time.time()
+        with _sender_lock:
+            ready = [account for account in accounts if _blocked_until.get(account.name, 0) <= now]
+            in_flight = dict(_in_flight)
+        ready = [account for account in ready if _daily_left(account, used) != 0]
+        if not ready:
+            return None
+        ready.sort(key=lambda account: (
+            in_flight.get(account.name, 0),
+            -(_daily_left(account, used) if account.per_day else float("inf")),
+        ))
+
+        wait = None
+        for account in ready:
+            bucket = _bucket(account)
+            account_wait = bucket.try_take() if bucket else 0
+            if not account_wait:
+                with _sender_lock:
+                    _in_flight[account.name] = _in_flight.get(account.name, 0) + 1
+                return account
+            wait = account_wait if wait is None else min(wait, account_wait)
+        time.sleep(wait)
+
+def _release_sender(account):
+    with _sender_lock:
+        _in_flight[account.name] -= 1
+
+def _send_with_failover(mailer, used, recipient, subject, html):
+    """
+    Sends from the best sender account, moving on to another one whenever an
+    account turns out unable to send. Returns (sent, account), with account
+    None when no account could take the message.
+    """
+    while True:
+        account = _pick_sender(mailer.accounts, used)
+        if account is None:
+            return False, None
+        try:
+            ok = mailer.send_as(account, recipient, subject, html)
+        except email_service.SenderUnavailable as e:
+            block_sender(account, e.reason)
+            continue
+        finally:
+            _release_sender(account)
+        if ok:
+            used[account.name] = used.get(account.name, 0) + 1
+        return ok, account
+
+
+def save_template(template_id, subject, template):
+    """Stores a compiled EmailTemplate for the messages queued with `template_id`."""
+    with storage.connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO outbox_templates (template_id, subject, parts, slots) VALUES (?, ?, ?, ?)",
+            (template_id, subject, json.dumps(template.parts), json.dumps(template.slots))
+        )
+
+def _load_template(template_id):
+    with storage.connect() as conn:
+        row = conn.execute(
+            "SELECT subject, parts, slots FROM outbox_templates WHERE template_id = ?", (template_id,)
+        ).fetchone()
+    if row is None:
+        return None
+    return row[0], email_service.EmailTemplate(json.loads(row[1]), json.loads(row[2]))
+
+def save_payload(template_id, payload):
+    """Stores the notifier payload for the chat/webhook messages queued with `template_id`."""
+    with storage.connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO outbox_payloads (template_id, payload) VALUES (?, ?)",
+            (template_id, json.dumps(payload))
+        )
+
+def _load_payload(template_id):
+    with storage.connect() as conn:
+        row = conn.execute("SELECT payload FROM outbox_payloads WHERE template_id = ?", (template_id,)).fetchone()
+    return None if row is None else json.loads(row[0])
+
+def enqueue(run_key, username, recipients, template_id, slot_values=None, send_at=None):
+    """
+    Queues the mail for `username` in this run, one message per address.
+    `slot_values` fills the template's per-user slots besides the username.
+    Messages are due at `send_at` (epoch), or right away.
+    Returns how many messages were newly queued (0 if the run already queued them).
+    """
+    now = max(time.time(), send_at or 0)
+    queued = 0
+    with storage.connect() as conn:
+        for recipient in recipients:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO outbox (run_key, username, recipient, template_id, slot_values, next_attempt_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (run_key, username, recipient, template_id, json.dumps(slot_values or {}), now)
+            )
+            queued += cursor.rowcount
+    return queued
+
+def retry_delay(attempts):
+    """Seconds to wait before the next try of a message that failed `attempts` times."""
+    return min(config.OUTBOX_RETRY_MAX, config.OUTBOX_RETRY_BASE * (2 ** (attempts - 1)))
+
+def _kind_filter(kind):
+    """SQL condition (and parameters) selecting the outbox rows of one channel kind."""
+    if kind == "email":
+        return "instr(recipient, ':') = 0", ()
+    return "recipient LIKE ?", (f"{kind}:%",)
+
+def _claim(owner, accounts, limit=CLAIM_BATCH, kind="email"):
+    """
+    Claims a batch of up to `limit` due messages of one channel kind for this
+    replica. Returns the claimed rows, or None when emails are due but the
+    daily quotas of all sender accounts are used up.
+    """
+    kind_sql, kind_params = _kind_filter(kind)
+    now = time.time()
+    # Mail queued for an earlier daily question is stale once the question rolls over
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    with storage.connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if kind == "email" and accounts and all(account.per_day for account in accounts):
+            used = _sent_last_day(conn, now)
+            # Messages other replicas are sending right now count against the quota too
+            in_flight = conn.execute(
+                f"SELECT COUNT(*) FROM outbox WHERE status = 'pending' AND claimed_until > ? AND claimed_by != ? AND {kind_sql}",
+                (now, owner, *kind_params)
+            ).fetchone()[0]
+            limit = min(limit, sum(_daily_left(account, used) for account in accounts) - in_flight)
+        rows = conn.execute(
+            "SELECT rowid, run_key, username, recipient, template_id, slot_values, attempts FROM outbox "
+            "WHERE status = 'pending' AND next_attempt_at <= ? AND run_key >= ? "
+            f"AND (claimed_until <= ? OR claimed_by = ?) AND {kind_sql} "
+            "ORDER BY next_attempt_at LIMIT ?",
+            (now, today, now, owner, *kind_params, max(1, limit))
+        ).fetchall()
+        if rows and limit <= 0:
+            return None
+        conn.executemany(
+            "UPDATE outbox SET claimed_by = ?, claimed_until = ? WHERE rowid = ?",
+            [(owner, now + config.OUTBOX_CLAIM_TTL, row[0]) for row in rows]
+        )
+    return rows
+
+def _release(rowids):
+    """Hands claimed messages back untried, for the next drain."""
+    with storage.connect() as conn:
+        conn.executemany("UPDATE outbox SET claimed_until = 0 WHERE rowid = ?", [(rowid,) for rowid in rowids])
+
+def _renew(owner):
+    """Extends this owner's live claims while it is still sending them."""
+    now = time.time()
+    with storage.connect() as conn:
+        conn.execute(
+            "UPDATE outbox SET claimed_until = ? WHERE claimed_by = ? AND status = 'pending' AND claimed_until > ?",
+            (now + config.OUTBOX_CLAIM_TTL, owner, now)
+        )
+
+class _ClaimKeeper:
+    """Renews an owner's claims a few times per OUTBOX_CLAIM_TTL while a batch is being sent."""
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.renewed_at = time.time()
+
+    def tick(self):
+        if time.time() - self.renewed_at >= config.OUTBOX_CLAIM_TTL / 3:
+            _renew(self.owner)
+            self.renewed_at = time.time()
+
+def _finish(rowid, sent, attempts, account=None):
+    """Records a send attempt; returns the message's new status."""
+    now = time.time()
+    if sent:
+        status, next_attempt_at = "sent", now
+    elif attempts >= config.OUTBOX_MAX_ATTEMPTS:
+        status, next_attempt_at = "failed", now
+    else:
+        status, next_attempt_at = "pending", now + retry_delay(attempts)
+    with storage.connect() as conn:
+        conn.execute(
+            "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, claimed_until = 0, sent_at = ? "
+            "WHERE rowid = ?",
+            (status, attempts, next_attempt_at, now if sent else None, rowid)
+        )
+        if sent and account is not None:
+            conn.execute("INSERT INTO outbox_sends (account, sent_at) VALUES (?, ?)", (account.name, now))
+    return status
+
+def _due_channel_kinds():
+    """The channel kinds besides email that have messages due now."""
+    with storage.connect() as conn:
+        rows = conn.execute(
+            "SELECT DISTINCT substr(recipient, 1, instr(recipient, ':') - 1) FROM outbox "
+            "WHERE status = 'pending' AND next_attempt_at <= ? AND instr(recipient, ':') > 0",
+            (time.time(),)
+        ).fetchall()
+    return [kind for (kind,) in rows]
+
+def drain(mailer=None, owner=None, heartbeat=None, limit=None):
+    """
+    Sends every due email in the outbox (or the `limit` oldest ones), oldest
+    first, and hands each chat/webhook channel with messages due to its
+    background drainer (see start_channel_drains), so a slow endpoint never
+    holds up the emails. Failed sends are retried later with exponential
+    backoff. Messages left behind by a crash are picked up by the next drain
+    once their claim runs out (OUTBOX_CLAIM_TTL; it is renewed while they are
+    being sent). Concurrent drains in one process need distinct `owner`s.
+    `heartbeat` is called after every email. Returns the number of emails sent.
+    """
+    if mailer is None:
+        with email_service.MailerGroup() as own_mailer:
+            return drain(own_mailer, owner, heartbeat, limit)
+
+    start_channel_drains()
+    return _drain_email(mailer, owner or sharding.replica_name(), heartbeat, limit)
+
+def start_channel_drains():
+    """
+    Starts a background thread sending the due messages of each channel kind
+    that has some, unless that kind's thread is still running; nothing waits
+    for them. Each kind has its own owner, so its claims stay apart from the
+    emails'.
+    """
+    for kind in _due_channel_kinds():
+        with _drainers_lock:
+            thread = _drainers.get(kind)
+            if thread is not None and thread.is_alive():
+                continue
+            thread = threading.Thread(
+                target=_drain_channel_safely, args=(kind, f"{sharding.replica_name()}/notify-{kind}"),
+                name=f"notify-{kind}", daemon=True,
+            )
+            _drainers[kind] = thread
+            thread.start()
+
+def wait_for_channel_drains(timeout=None):
+    """Waits up to `timeout` seconds for the running channel drainers to finish, e.g. before exiting."""
+    with _drainers_lock:
+        threads = list(_drainers.values())
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for thread in threads:
+        thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+
+def _drain_channel_safely(kind, owner):
+    try:
+        _drain_channel(kind, owner)
+    except Exception as e:
+        # Whatever stays claimed is picked up by a later drain once the claim runs out
+        get_sink().error(f"\n Error while sending {kind} notifications: {type(e).__name__}")
+
+def _drain_email(mailer, owner, heartbeat=None, limit=None):
+    """
+    Sends due emails spread over the sender accounts of `mailer` (a
+    MailerGroup), within each account's per-minute and per-day limits. An
+    account that hits a limit or fails to log in is skipped for a while and
+    the message goes out from another one.
+    """
+    sink = get_sink()
+    templates = {}
+    sent = 0
+    attempted = 0
+    while limit is None or attempted < limit:
+        batch = _claim(owner, mailer.accounts, CLAIM_BATCH if limit is None else min(CLAIM_BATCH, limit - attempted))
+        if batch is None:
+            sink.info("The daily sending quota of every sender account is used up; the rest stay queued.")
+            return sent
+        if not batch:
+            return sent
+
+        attempted += len(batch)
+        keeper = _ClaimKeeper(owner)
+        with storage.connect() as conn:
+            used = _sent_last_day(conn, time.time())
+        for index, (rowid, run_key, username, recipient, template_id, slot_values, attempts) in enumerate(batch):
+            if template_id not in templates:
+                templates[template_id] = _load_template(template_id)
+            if templates[template_id] is None:
+                _finish(rowid, False, config.OUTBOX_MAX_ATTEMPTS)
+                continue
+            subject, template = templates[template_id]
+
+            with sink.stage("send_email", 'Sending mail..', spinner='bouncingBar', color='yellow', username=username) as spinner:
+                html = template.render(username, **json.loads(slot_values))
+                ok, account = _send_with_failover(mailer, used, recipient, subject, html)
+                if account is None:
+                    _release([row[0] for row in batch[index:]])
+                    spinner.fail(f'No sender account can send right now; mail to user {username} and the rest stay queued')
+                    return sent
+                status = _finish(rowid, ok, attempts + 1, account)
+                if ok:
+                    sent += 1
+                    spinner.succeed(f"Mail sent successfully! to user {username}")
+                elif status == "pending":
+                    spinner.fail(f'Failed to send mail to user {username}, retrying in {retry_delay(attempts + 1):.0f}s')
+                else:
+                    spinner.fail(f'Failed to send mail to user {username}, giving up after {attempts + 1} attempts')
+            keeper.tick()
+            if heartbeat:
+                heartbeat()
+    return sent
+
+def _drain_channel(kind, owner, heartbeat=None, limit=None):
+    """
+    Sends due chat/webhook messages of one channel kind. Messages to the same
+    address are combined up to the channel's bulk size, with up to
+    NOTIFY_CONCURRENCY requests in flight at once.
+    """
+    channel = notifier.CHANNELS.get(kind)
+    payloads = {}
+    sent = 0
+    attempted = 0
+    with ThreadPoolExecutor(max_workers=max(1, config.NOTIFY_CONCURRENCY), thread_name_prefix=f"notify-{kind}") as pool:
+        while limit is None or attempted < limit:
+            batch = _claim(owner, None, CLAIM_BATCH if limit is None else min(CLAIM_BATCH, limit - attempted), kind)
+            if not batch:
+                return sent
+
+            attempted += len(batch)
+            by_address = {}
+            for rowid, run_key, username, recipient, template_id, slot_values, attempts in batch:
+                if template_id not in payloads:
+                    payloads[template_id] = _load_payload(template_id)
+                if channel is None or payloads[template_id] is None:
+                    _finish(rowid, False, config.OUTBOX_MAX_ATTEMPTS)
+                    continue
+                notification = dict(payloads[template_id], username=username, **json.loads(slot_values))
+                by_address.setdefault(notifier.split_recipient(recipient)[1], []).append((rowid, attempts, notification))
+
+            size = channel.bulk_size() if channel else 1
+            requests = [
+                (address, rows[i:i + size]) for address, rows in by_address.items() for i in range(0, len(rows), size)
+            ]
+            keeper = _ClaimKeeper(owner)
+            for count in pool.map(lambda request: _notify(channel, *request), requests):
+                sent += count
+                keeper.tick()
+                if heartbeat:
+                    heartbeat()
+    return sent
+
+def _notify(channel, address, rows):
+    """Sends one bulk request of a channel and records the outcome of its messages."""
+    usernames = ", ".join(notification["username"] for _, _, notification in rows)
+    with get_sink().stage("notify", f'Sending {channel.kind} notification..', spinner='bouncingBar', color='yellow',
+                          channel=channel.kind, messages=len(rows)) as spinner:
+        ok = channel.send(address, [notification for _, _, notification in rows])
+        statuses = [_finish(rowid, ok, attempts + 1) for rowid, attempts, _ in rows]
+        if ok:
+            spinner.succeed(f"{channel.kind} notification sent for {usernames}")
+        elif "pending" in statuses:
+            spinner.fail(f"Failed to send {channel.kind} notification for {usernames}, retrying later")
+        else:
+            spinner.fail(f"Failed to send {channel.kind} notification for {usernames}, giving up")
+    return len(rows) if ok else 0
+
+def counts():
+    """Returns the number of outbox messages per status."""
+    with storage.connect() as conn:
+        return dict(conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+
+def prometheus_lines():
+    """Renders the outbox size per status for the metrics endpoint."""
+    try:
+        by_status = counts()
+    except sqlite3.Error:
+        return []
+    name = "leetbot_outbox_messages"
+    lines = [f"# HELP {name} Outbox messages per status.", f"# TYPE {name} gauge"]
+    lines += [f'{name}{metrics.format_labels(status=status)} {count}' for status, count in sorted(by_status.items())]
+    try:
+        with storage.connect() as conn:
+            by_account = _sent_last_day(conn, time.time())
+    except sqlite3.Error:
+        return lines
+    name = "leetbot_smtp_sent_last_day"
+    lines += [f"# HELP {name} Messages sent from each sender account in the last 24 hours.", f"# TYPE {name} gauge"]
+    lines += [f'{name}{metrics.format_labels(account=account)} {count}' for account, count in sorted(by_account.items())]
+    return lines
+
+metrics.register_collector(prometheus_lines)
+
+def prune(current_date):
+    """
+    Drops mail queued for questions older than `current_date`. Sent rows are
+    kept for a day since they count against the daily quota.
+    """
+    with storage.connect() as conn:
+        conn.execute("DELETE FROM outbox_sends WHERE sent_at < ?", (time.time() - DAY_SECONDS,))
+        conn.execute(
+            "DELETE FROM outbox WHERE run_key < ? AND (sent_at IS NULL OR sent_at < ?)",
+            (current_date, time.time() - DAY_SECONDS)
+        )
+        conn.execute(
+            "DELETE FROM outbox_templates WHERE template_id < ? "
+            "AND template_id NOT IN (SELECT DISTINCT template_id FROM outbox)",
+            (current_date,)
+        )
+        conn.execute(
+            "DELETE FROM outbox_payloads WHERE template_id < ? "
+            "AND template_id NOT IN (SELECT DISTINCT template_id FROM outbox)",
+            (current_date,)
+        )
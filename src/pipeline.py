@@ -0,0 +1,123 @@
+import queue
+import threading
+from . import metrics
+
+QUEUE_DEPTH = metrics.Gauge("leetbot_pipeline_queue_depth", "Batches waiting in front of each pipeline stage.", ["stage"])
+QUEUE_PEAK = metrics.Gauge("leetbot_pipeline_queue_peak", "Most batches that waited in front of each stage during the last run.", ["stage"])
+BUSY_WORKERS = metrics.Gauge("leetbot_pipeline_busy_workers", "Workers of each pipeline stage processing a batch.", ["stage"])
+
+# Tells a worker that nothing more will arrive on its queue
+_DONE = object()
+# How often a blocked producer checks whether the pipeline failed
+_POLL_SECONDS = 0.5
+
+
+class Stage:
+    """
+    One step of a pipeline: `work(item)` runs on `workers` threads and its
+    return value is passed on to the next stage (None passes nothing on).
+    """
+
+    def __init__(self, name, work, workers=1):
+        self.name = name
+        self.work = work
+        self.workers = max(1, workers)
+
+
+class Pipeline:
+    """
+    Runs items through stages connected by bounded queues. When a stage falls
+    behind, its queue fills up and the stage before it blocks on put, so a
+    slow stage (e.g. SMTP) slows the whole pipeline down instead of letting
+    work pile up in memory: at most about `queue_size + workers` items are
+    held per stage however many items the source yields.
+    """
+
+    def __init__(self, stages, queue_size=2):
+        self.stages = list(stages)
+        self.queue_size = max(1, queue_size)
+        self.peaks = {}
+        self._error = None
+        self._lock = threading.Lock()
+
+    def _put(self, stage, q, item):
+        """Blocks until `item` fits in q; returns False if the pipeline failed meanwhile."""
+        while self._error is None:
+            try:
+                q.put(item, timeout=_POLL_SECONDS)
+            except queue.Full:
+                continue
+            depth = q.qsize()
+            QUEUE_DEPTH.set(depth, stage=stage.name)
+            with self._lock:
+                if depth > self.peaks.get(stage.name, 0):
+                    self.peaks[stage.name] = depth
+                    QUEUE_PEAK.set(depth, stage=stage.name)
+            return True
+        return False
+
+    def _worker(self, index, queues, remaining):
+        stage = self.stages[index]
+        q = queues[index]
+        downstream = index + 1 < len(self.stages)
+        while True:
+            item = q.get()
+            QUEUE_DEPTH.set(q.qsize(), stage=stage.name)
+            if item is _DONE:
+                break
+            # After a failure items are only drained, so no producer stays blocked
+            if self._error is not None:
+                continue
+            BUSY_WORKERS.inc(stage=stage.name)
+            try:
+                result = stage.work(item)
+            except BaseException as e:
+                with self._lock:
+                    if self._error is None:
+                        self._error = e
+                continue
+            finally:
+                BUSY_WORKERS.inc(-1, stage=stage.name)
+            if downstream and result is not None:
+                self._put(self.stages[index + 1], queues[index + 1], result)
+
+        with self._lock:
+            remaining[index] -= 1
+            last = remaining[index] == 0
+        # The last worker of a stage to finish closes the next stage's queue
+        if last and downstream:
+            for _ in range(self.stages[index + 1].workers):
+                queues[index + 1].put(_DONE)
+
+    def run(self, source):
+        """
+        Feeds every item of `source` into the first stage from the calling
+        thread and waits until the last stage is done. Re-raises the first
+        error any stage raised; the source stops being read after it.
+        """
+        self._error = None
+        self.peaks = {stage.name: 0 for stage in self.stages}
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        remaining = [stage.workers for stage in self.stages]
+        threads = []
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._worker, args=(index, queues, remaining),
+                    name=f"pipeline-{stage.name}-{n}", daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+
+        try:
+            for item in source:
+                if not self._put(self.stages[0], queues[0], item):
+                    break
+        finally:
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_DONE)
+            for thread in threads:
+                thread.join()
+
+        if self._error is not None:
+            raise self._error
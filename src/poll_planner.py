@@ -0,0 +1,100 @@
+import json
+from datetime import datetime, timezone
+from . import config
+from . import storage
+
+# The most recent accepted-submission times of each user, as minutes of the UTC
+# day (the daily question's day), and the newest submission already counted
+storage.register_schema("""
+CREATE TABLE IF NOT EXISTS solve_profiles (
+    username TEXT PRIMARY KEY,
+    minutes TEXT NOT NULL,
+    last_seen INTEGER NOT NULL
+);
+""")
+
+# Solve times remembered per user; older ones are forgotten so the plan follows habit changes
+MAX_SAMPLES = 60
+DAY_MINUTES = 24 * 60
+# The daily question rolls over at 00:00 UTC, before the 17:00 PST countdown
+# deadline of get_deadline_for_potd, so the rollover is the real cutoff
+CUTOFF_MINUTE = DAY_MINUTES
+
+
+def minute_of_day(timestamp):
+    """Minutes since 00:00 UTC of the day `timestamp` falls on."""
+    moment = datetime.fromtimestamp(int(timestamp), timezone.utc)
+    return moment.hour * 60 + moment.minute
+
+def percentile(sorted_values, fraction):
+    """The value `fraction` of the way through sorted_values (nearest rank)."""
+    return sorted_values[int(fraction * (len(sorted_values) - 1))]
+
+def plan_checks(minutes):
+    """
+    Returns the minutes of the UTC day at which a user with these past solve
+    times should be checked, or None when there are too few samples to plan.
+    One check lands PLANNER_LEAD_MINUTES before the user usually starts
+    solving (the 20th percentile of their solve times), and one lands
+    PLANNER_FINAL_MINUTES before the question rolls over, so anyone still
+    unsolved is reminded before it is too late.
+    """
+    if len(minutes) < config.PLANNER_MIN_SAMPLES:
+        return None
+    final = CUTOFF_MINUTE - config.PLANNER_FINAL_MINUTES
+    early = percentile(sorted(minutes), 0.2) - config.PLANNER_LEAD_MINUTES
+    checks = [final]
+    # Skip the early check when it would barely precede the final one
+    if 0 <= early < final - config.PLANNER_LEAD_MINUTES:
+        checks.insert(0, early)
+    return checks
+
+def observe(submissions_by_user):
+    """Adds the accepted submissions not seen before to each user's solve-time profile."""
+    usernames = [username for username, submissions in submissions_by_user.items() if submissions]
+    if not usernames:
+        return
+    with storage.connect() as conn:
+        profiles = {}
+        # Stay well below sqlite's bound-parameter limit
+        for i in range(0, len(usernames), 500):
+            chunk = usernames[i:i + 500]
+            rows = conn.execute(
+                f"SELECT username, minutes, last_seen FROM solve_profiles WHERE username IN ({','.join('?' * len(chunk))})",
+                chunk
+            ).fetchall()
+            profiles.update((username, (json.loads(minutes), last_seen)) for username, minutes, last_seen in rows)
+
+        updates = []
+        for username in usernames:
+            minutes, last_seen = profiles.get(username, ([], 0))
+            new = sorted(int(sub["timestamp"]) for sub in submissions_by_user[username] if int(sub["timestamp"]) > last_seen)
+            if not new:
+                continue
+            minutes = (minutes + [minute_of_day(ts) for ts in new])[-MAX_SAMPLES:]
+            updates.append((username, json.dumps(minutes), new[-1]))
+        conn.executemany(
+            "INSERT OR REPLACE INTO solve_profiles (username, minutes, last_seen) VALUES (?, ?, ?)", updates
+        )
+
+def planned_times(usernames):
+    """
+    Returns {username: [(hour, minute), ...] UTC} for the users whose profile
+    is complete enough to plan; the rest keep their configured times.
+    """
+    usernames = list(usernames)
+    plans = {}
+    if not config.ADAPTIVE_POLLING:
+        return plans
+    with storage.connect() as conn:
+        for i in range(0, len(usernames), 500):
+            chunk = usernames[i:i + 500]
+            rows = conn.execute(
+                f"SELECT username, minutes FROM solve_profiles WHERE username IN ({','.join('?' * len(chunk))})",
+                chunk
+            ).fetchall()
+            for username, minutes in rows:
+                checks = plan_checks(json.loads(minutes))
+                if checks:
+                    plans[username] = [divmod(minute, 60) for minute in checks]
+    return plans
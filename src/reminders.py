@@ -0,0 +1,235 @@
+import heapq
+import time
+import zlib
+from itertools import islice
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from . import config
+from . import poll_planner
+from . import user_store
+from .log_sink import get_sink
+
+# How often the queue looks for changes to the users file while no one is due
+POLL_SECONDS = 60
+
+
+def user_timezone(user):
+    """The user's "timezone" (an IANA name such as "Europe/Berlin"), or DEFAULT_TIMEZONE."""
+    name = user.get("timezone") or config.DEFAULT_TIMEZONE
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        get_sink().error(f" Unknown timezone {name!r} for user {user.get('username')}, using {config.DEFAULT_TIMEZONE}.")
+        return ZoneInfo(config.DEFAULT_TIMEZONE)
+
+def reminder_times(user):
+    """The user's local "reminder_times" as (hour, minute) pairs, or DEFAULT_REMINDER_TIMES."""
+    times = user.get("reminder_times") or config.DEFAULT_REMINDER_TIMES
+    if isinstance(times, str):
+        times = [times]
+    parsed = []
+    for hhmm in times:
+        try:
+            hour, minute = (int(part) for part in str(hhmm).split(":"))
+            if 0 <= hour < 24 and 0 <= minute < 60:
+                parsed.append((hour, minute))
+                continue
+        except ValueError:
+            pass
+        get_sink().error(f" Invalid reminder time {hhmm!r} for user {user.get('username')}, skipping it.")
+    return sorted(parsed)
+
+def spread_offset(username):
+    """A stable per-user advance of 1..REMINDER_SPREAD_MINUTES minutes, in seconds."""
+    if config.REMINDER_SPREAD_MINUTES <= 0:
+        return 0
+    return (zlib.crc32(username.encode("utf-8")) % config.REMINDER_SPREAD_MINUTES + 1) * 60
+
+def _occurrences(user, around, plan=None):
+    """
+    The user's reminder times (epoch) from the local day before `around` to
+    two days after, each moved spread_offset earlier. `plan` holds UTC
+    (hour, minute) check times from the poll planner, used unless the user
+    chose their own reminder_times.
+    """
+    if plan and not user.get("reminder_times"):
+        tz, times_of_day = timezone.utc, plan
+    else:
+        tz, times_of_day = user_timezone(user), reminder_times(user)
+    offset = spread_offset(user["username"])
+    local_day = datetime.fromtimestamp(around, tz).date()
+    times = []
+    for delta in (-1, 0, 1, 2):
+        day = local_day + timedelta(days=delta)
+        for hour, minute in times_of_day:
+            local = datetime(day.year, day.month, day.day, hour, minute, tzinfo=tz)
+            times.append(local.timestamp() - offset)
+    return sorted(times)
+
+def next_due(user, after, plan=None):
+    """The user's first reminder strictly after epoch `after`, or None if they have no times."""
+    return next((t for t in _occurrences(user, after, plan) if t > after), None)
+
+def previous_due(user, now, plan=None):
+    """The user's latest reminder at or before epoch `now`, or None."""
+    return next((t for t in reversed(_occurrences(user, now, plan)) if t <= now), None)
+
+def run_start(due):
+    """
+    When the user due at epoch `due` is checked: the start of its
+    REMINDER_SPREAD_MINUTES window, so everyone due in one window shares a
+    run and only their messages go out at their own times.
+    """
+    window = config.REMINDER_SPREAD_MINUTES * 60
+    if window <= 0:
+        return due
+    return due - due % window
+
+def slot_name(due):
+    """Names the run for everyone due at epoch `due`: the UTC HH:MM it starts at."""
+    return datetime.fromtimestamp(run_start(due), timezone.utc).strftime("%H:%M")
+
+
+class ReminderQueue:
+    """
+    Every user's next reminder in a heap keyed by due time, so each run only
+    checks the users who are due instead of everyone at four global slots.
+    """
+
+    def __init__(self, store=None):
+        self.store = store or user_store.default_store()
+        self._heap = []
+        self._signature = None
+
+    def load(self, now=None, catch_up_since=None):
+        """
+        Rebuilds the heap from the users file. With `catch_up_since`, a user's
+        latest reminder between then and now is due immediately, so a restart
+        redoes the slot it may have interrupted (the outbox keeps anyone from
+        being mailed twice).
+        """
+        now = now if now is not None else time.time()
+        heap = []
+        users = self.store.iter_users()
+        while True:
+            chunk = list(islice(users, 500))
+            if not chunk:
+                break
+            plans = poll_planner.planned_times(user["username"] for user in chunk)
+            for user in chunk:
+                plan = plans.get(user["username"])
+                due = None
+                if catch_up_since is not None:
+                    due = previous_due(user, now, plan)
+                    if due is not None and due < catch_up_since:
+                        due = None
+                if due is None:
+                    due = next_due(user, now, plan)
+                if due is not None:
+                    heap.append((due, user["username"]))
+        heapq.heapify(heap)
+        self._heap = heap
+        self._signature = self.store.signature()
+        return len(heap)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def next_time(self, now=None):
+        """When run_due should next be called: the next due user, or the next users file check."""
+        now = now if now is not None else time.time()
+        poll = now + POLL_SECONDS
+        return min(run_start(self._heap[0][0]), poll) if self._heap else poll
+
+    def pop_slot(self, now):
+        """
+        Removes every user of the earliest run that starts at or before `now`,
+        including those due later in its window, and returns
+        (slot, {username: due}), or None when no run has started.
+        """
+        if not self._heap or run_start(self._heap[0][0]) > now:
+            return None
+        start = run_start(self._heap[0][0])
+        due_by_user = {}
+        while self._heap and run_start(self._heap[0][0]) == start:
+            due, username = heapq.heappop(self._heap)
+            due_by_user[username] = due
+        return slot_name(start), due_by_user
+
+    def _requeue(self, due_by_user, now):
+        """Queues the users of a slot that ran (or failed) again for their next reminder."""
+        # The run may have taught the planner new solve times
+        users_left = iter(self.store.select(due_by_user))
+        while True:
+            users = list(islice(users_left, 500))
+            if not users:
+                return
+            plans = poll_planner.planned_times(user["username"] for user in users)
+            for user in users:
+                due = next_due(user, max(now, due_by_user[user["username"]]), plans.get(user["username"]))
+                if due is not None:
+                    heapq.heappush(self._heap, (due, user["username"]))
+
+    def run_due(self, run, now=None):
+        """
+        Calls run(run_slot=..., users=...) once per slot for the users that
+        are due, then queues each of them again for their next reminder.
+        `users` is re-read from the store page by page each time it is
+        iterated, so a slot holding the whole user base stays small in memory;
+        each user carries "send_at", their own due time.
+        Slots are taken off the queue one at a time: if a run raises, its users
+        are queued again and the later slots stay due for the next call.
+        Returns the number of users run.
+        """
+        now = now if now is not None else time.time()
+        if self.store.signature() != self._signature:
+            self.load(now)
+
+        ran = 0
+        while True:
+            popped = self.pop_slot(now)
+            if popped is None:
+                return ran
+            slot, due_by_user = popped
+            try:
+                run(run_slot=slot, users=self.store.select(due_by_user, send_at=due_by_user))
+            finally:
+                self._requeue(due_by_user, now)
+            ran += len(due_by_user)
+
+def simulate(store=None, start=None, days=1, bucket_minutes=60):
+    """
+    Replays the queue over `days` days from `start` (epoch, default now)
+    without checking anyone. Returns {bucket start epoch: users due}.
+    """
+    start = start if start is not None else time.time()
+    end = start + days * 24 * 60 * 60
+    queue = ReminderQueue(store)
+    queue.load(start)
+    bucket_seconds = bucket_minutes * 60
+    buckets = {}
+
+    def count(run_slot, users):
+        bucket = clock - clock % bucket_seconds
+        buckets[bucket] = buckets.get(bucket, 0) + len(users)
+
+    clock = start
+    while queue and run_start(queue._heap[0][0]) < end:
+        clock = run_start(queue._heap[0][0])
+        queue.run_due(count, now=clock)
+    return buckets
+
+def print_simulation(buckets, days, bucket_minutes=60):
+    """Prints the simulated load per bucket of the UTC day, averaged over the days."""
+    per_slot = {}
+    for bucket, users in buckets.items():
+        label = datetime.fromtimestamp(bucket, timezone.utc).strftime("%H:%M")
+        per_slot[label] = per_slot.get(label, 0) + users
+    total = sum(per_slot.values())
+    peak = max(per_slot.values(), default=0)
+    print(f"Simulated {days} day(s): {total} user checks, {total / max(1, days):.0f} per day")
+    print(f"Busiest {bucket_minutes}-minute window: {peak / max(1, days):.0f} users per day")
+    for label in sorted(per_slot):
+        average = per_slot[label] / max(1, days)
+        bar = "#" * max(1, round(50 * per_slot[label] / peak)) if peak else ""
+        print(f"  {label} UTC {average:10.1f}  {bar}")
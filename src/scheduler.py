@@ -0,0 +1,79 @@
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from .log_sink import get_sink
+
+# Longest single sleep, so a suspended VM or a clock change is noticed reasonably soon
+MAX_SLEEP_SECONDS = 15 * 60
+
+
+def next_daily_time(hhmm, now=None):
+    """Returns the next epoch time at which the UTC wall clock reads `hhmm` (HH:MM)."""
+    now = now if now is not None else time.time()
+    hour, minute = (int(part) for part in hhmm.split(":"))
+    current = datetime.fromtimestamp(now, timezone.utc)
+    candidate = current.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if candidate.timestamp() <= now:
+        candidate += timedelta(days=1)
+    return candidate.timestamp()
+
+
+class Scheduler:
+    """
+    Runs daily jobs at fixed UTC times, and interval jobs, from a single
+    thread that sleeps until the next job is due, instead of polling.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+
+    def every_day_at(self, hhmm, job, *args, **kwargs):
+        """Runs job(*args, **kwargs) every day at `hhmm` UTC."""
+        self._push(next_daily_time(hhmm), f"at {hhmm} UTC", lambda now: next_daily_time(hhmm, now), job, args, kwargs)
+
+    def every(self, seconds, job, *args, **kwargs):
+        """Runs job(*args, **kwargs) every `seconds`, starting `seconds` from now."""
+        self._push(time.time() + seconds, f"every {seconds}s", lambda now: now + seconds, job, args, kwargs)
+
+    def repeat(self, next_time, job, *args, label="", **kwargs):
+        """Runs job(*args, **kwargs) at next_time(now), asking next_time again after every run."""
+        self._push(next_time(time.time()), label, next_time, job, args, kwargs)
+
+    def _push(self, when, label, reschedule, job, args, kwargs):
+        with self._lock:
+            heapq.heappush(self._heap, (when, next(self._order), label, reschedule, job, args, kwargs))
+        self._wakeup.set()
+
+    def next_run_time(self):
+        """Returns the epoch time of the next due job, or None if nothing is scheduled."""
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def run_forever(self):
+        """Runs due jobs until stop() is called."""
+        while not self._stopped:
+            self._wakeup.clear()
+            next_time = self.next_run_time()
+            delay = MAX_SLEEP_SECONDS if next_time is None else next_time - time.time()
+            if delay > 0:
+                self._wakeup.wait(min(delay, MAX_SLEEP_SECONDS))
+                continue
+
+            with self._lock:
+                _, _, label, reschedule, job, args, kwargs = heapq.heappop(self._heap)
+            try:
+                job(*args, **kwargs)
+            except Exception as e:
+                get_sink().error(f"\nAn error occurred in the job scheduled {label}: {e}")
+            self._push(reschedule(time.time()), label, reschedule, job, args, kwargs)
+
+    def stop(self):
+        """Makes run_forever return after the job in progress, if any."""
+        self._stopped = True
+        self._wakeup.set()
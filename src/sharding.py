@@ -0,0 +1,177 @@
+import bisect
+import hashlib
+import json
+import os
+import socket
+import time
+import uuid
+from functools import lru_cache
+from . import config
+from . import storage
+
+# Which replica is working on a shard for a given run, and until when
+storage.register_schema("""
+CREATE TABLE IF NOT EXISTS shard_leases (
+    run_key TEXT NOT NULL,
+    shard INTEGER NOT NULL,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (run_key, shard)
+);
+CREATE TABLE IF NOT EXISTS shard_runs (
+    run_key TEXT PRIMARY KEY,
+    started_at REAL NOT NULL,
+    usernames TEXT
+);
+""")
+
+# Points per shard on the hash ring, which keeps shards evenly sized
+VIRTUAL_NODES = 64
+
+def _hash(value):
+    return int.from_bytes(hashlib.sha1(value.encode("utf-8")).digest()[:8], "big")
+
+@lru_cache(maxsize=8)
+def _ring(shard_count):
+    points = sorted((_hash(f"shard-{shard}-{v}"), shard) for shard in range(shard_count) for v in range(VIRTUAL_NODES))
+    return [p[0] for p in points], [p[1] for p in points]
+
+def shard_for(username, shard_count=None):
+    """Returns the shard owning `username` by consistent hashing, so resizing moves few users."""
+    shard_count = shard_count or config.SHARD_COUNT
+    if shard_count <= 1:
+        return 0
+    hashes, shards = _ring(shard_count)
+    i = bisect.bisect(hashes, _hash(username)) % len(hashes)
+    return shards[i]
+
+# Tells this process apart from earlier or concurrent ones with the same hostname and pid,
+# e.g. containers that all run the bot as pid 1
+BOOT_ID = uuid.uuid4().hex[:12]
+
+def replica_name():
+    """Identifies this process in leases and outbox claims."""
+    return f"{socket.gethostname()}:{os.getpid()}:{BOOT_ID}"
+
+
+class ShardLease:
+    """A time-limited claim on one shard of one run, kept alive with heartbeat()."""
+
+    def __init__(self, run_key, shard, owner):
+        self.run_key = run_key
+        self.shard = shard
+        self.owner = owner
+        self._renewed_at = time.time()
+
+    def heartbeat(self):
+        """Extends the lease, at most a few times per TTL."""
+        now = time.time()
+        if now - self._renewed_at < config.SHARD_LEASE_TTL / 3:
+            return
+        with storage.connect() as conn:
+            conn.execute(
+                "UPDATE shard_leases SET expires_at = ? WHERE run_key = ? AND shard = ? AND owner = ?",
+                (now + config.SHARD_LEASE_TTL, self.run_key, self.shard, self.owner)
+            )
+        self._renewed_at = now
+
+    def complete(self):
+        """Marks the shard finished for this run so nobody takes it over."""
+        with storage.connect() as conn:
+            conn.execute(
+                "UPDATE shard_leases SET done = 1 WHERE run_key = ? AND shard = ? AND owner = ?",
+                (self.run_key, self.shard, self.owner)
+            )
+
+
+def try_acquire(run_key, shard, owner):
+    """
+    Claims `shard` for this run. A shard can be claimed when nobody holds it
+    or when its holder's lease expired without finishing.
+    Returns a ShardLease, or None if the shard is busy or already done.
+    """
+    now = time.time()
+    with storage.connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT owner, expires_at, done FROM shard_leases WHERE run_key = ? AND shard = ?",
+            (run_key, shard)
+        ).fetchone()
+        if row is None:
+            conn.execute(
+                "INSERT INTO shard_leases (run_key, shard, owner, expires_at) VALUES (?, ?, ?, ?)",
+                (run_key, shard, owner, now + config.SHARD_LEASE_TTL)
+            )
+        else:
+            holder, expires_at, done = row
+            if done or (holder != owner and expires_at > now):
+                return None
+            conn.execute(
+                "UPDATE shard_leases SET owner = ?, expires_at = ? WHERE run_key = ? AND shard = ?",
+                (owner, now + config.SHARD_LEASE_TTL, run_key, shard)
+            )
+    return ShardLease(run_key, shard, owner)
+
+def register_run(run_key, usernames=None):
+    """
+    Records which users a run covers (None for everyone), the first time any
+    replica starts it, so another replica can take over a shard of it later.
+    """
+    with storage.connect() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO shard_runs (run_key, started_at, usernames) VALUES (?, ?, ?)",
+            (run_key, time.time(), None if usernames is None else json.dumps(list(usernames)))
+        )
+
+def orphaned_shards(current_date):
+    """
+    Returns [(run_key, usernames or None, [shard, ...])] for the runs of the
+    question dated `current_date` with shards nobody is finishing: their
+    holder's lease expired, or no replica claimed them within SHARD_LEASE_TTL
+    of the run's start.
+    """
+    now = time.time()
+    with storage.connect() as conn:
+        runs = conn.execute(
+            "SELECT run_key, started_at, usernames FROM shard_runs WHERE substr(run_key, 1, ?) = ?",
+            (len(current_date) + 1, f"{current_date}/")
+        ).fetchall()
+        leases = {}
+        for run_key, shard, expires_at, done in conn.execute(
+            "SELECT run_key, shard, expires_at, done FROM shard_leases WHERE substr(run_key, 1, ?) = ?",
+            (len(current_date) + 1, f"{current_date}/")
+        ):
+            leases[run_key, shard] = (expires_at, done)
+
+    orphaned = []
+    for run_key, started_at, usernames in runs:
+        shards = []
+        for shard in range(config.SHARD_COUNT):
+            expires_at, done = leases.get((run_key, shard), (started_at + config.SHARD_LEASE_TTL, 0))
+            if not done and expires_at <= now:
+                shards.append(shard)
+        if shards:
+            orphaned.append((run_key, None if usernames is None else json.loads(usernames), shards))
+    return orphaned
+
+def claim_shards(run_key, owner=None, shards=None):
+    """
+    Yields a lease for each of `shards` (default: this replica's own shard,
+    SHARD_INDEX) that this replica can claim for the run right now. It never
+    waits for other replicas: shards they leave unfinished are taken over
+    later from orphaned_shards.
+    """
+    owner = owner or replica_name()
+    if shards is None:
+        shards = [config.SHARD_INDEX % max(1, config.SHARD_COUNT)]
+    for shard in shards:
+        lease = try_acquire(run_key, shard, owner)
+        if lease:
+            yield lease
+
+def prune(current_date):
+    """Forgets leases of runs for older questions."""
+    with storage.connect() as conn:
+        conn.execute("DELETE FROM shard_leases WHERE run_key < ?", (current_date,))
+        conn.execute("DELETE FROM shard_runs WHERE run_key < ?", (current_date,))
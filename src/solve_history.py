@@ -0,0 +1,207 @@
+import mmap
+import os
+import threading
+from datetime import date as date_cls, timedelta
+from . import config
+from . import storage
+
+# Each user owns one fixed row in every yearly bitmap file; bit d of a row is
+# day-of-year d (0-based) of that year's daily questions
+storage.register_schema("""
+CREATE TABLE IF NOT EXISTS history_rows (
+    username TEXT PRIMARY KEY,
+    row INTEGER NOT NULL UNIQUE
+);
+""")
+
+# 366 days rounded up to whole bytes
+ROW_BYTES = 46
+# Rows a bitmap file grows by at least, so growing is rare
+MIN_GROW_ROWS = 4096
+# How long a daily question is remembered after its day ends, for backfilling
+QUESTION_KEEP_SECONDS = 3 * 24 * 3600
+
+_maps = {}
+_lock = threading.Lock()
+
+
+def _path(year):
+    return os.path.join(config.SOLVE_HISTORY_DIR, f"{year}.bin")
+
+def _day_bits(year):
+    return 366 if date_cls(year, 12, 31).timetuple().tm_yday == 366 else 365
+
+def _map(year, rows, grow=False):
+    """
+    Returns the mmap of a year's bitmap if it covers `rows` rows, growing the
+    file first when `grow` is set; otherwise returns None.
+    """
+    with _lock:
+        current = _maps.get(year)
+        needed = rows * ROW_BYTES
+        if current is not None and len(current) >= needed:
+            return current
+
+        path = _path(year)
+        if not grow and not os.path.exists(path):
+            return None
+        os.makedirs(config.SOLVE_HISTORY_DIR, exist_ok=True)
+        with open(path, "a+b") as f:
+            size = os.fstat(f.fileno()).st_size
+            if grow and size < needed:
+                # Another process may have grown the file already; it only ever grows
+                size = max(needed, 2 * size, MIN_GROW_ROWS * ROW_BYTES)
+                f.truncate(size)
+            if size < needed or size == 0:
+                return None
+            # Readers may still hold the old map, so it is left for the garbage collector
+            _maps[year] = mmap.mmap(f.fileno(), size)
+        return _maps[year]
+
+def _years():
+    """Years that have a bitmap file, oldest first."""
+    try:
+        names = os.listdir(config.SOLVE_HISTORY_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[:-4]) for name in names if name.endswith(".bin") and name[:-4].isdigit())
+
+def row_numbers(usernames, create=False):
+    """Returns {username: row} for the users that have a row, assigning new rows when `create` is set."""
+    usernames = list(dict.fromkeys(usernames))
+    rows = {}
+    with storage.connect() as conn:
+        if create:
+            conn.execute("BEGIN IMMEDIATE")
+        # Stay well below sqlite's bound-parameter limit
+        for i in range(0, len(usernames), 500):
+            chunk = usernames[i:i + 500]
+            rows.update(conn.execute(
+                f"SELECT username, row FROM history_rows WHERE username IN ({','.join('?' * len(chunk))})",
+                chunk
+            ).fetchall())
+        if create:
+            missing = [username for username in usernames if username not in rows]
+            (next_row,) = conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM history_rows").fetchone()
+            new_rows = [(username, next_row + i) for i, username in enumerate(missing)]
+            conn.executemany("INSERT INTO history_rows (username, row) VALUES (?, ?)", new_rows)
+            rows.update(new_rows)
+    return rows
+
+def record_solves(usernames, date):
+    """Sets the bit for `date` (the daily question's YYYY-MM-DD) for every user in usernames."""
+    rows = row_numbers(usernames, create=True)
+    if not rows:
+        return
+    day = date_cls.fromisoformat(date)
+    bit = day.timetuple().tm_yday - 1
+    mapped = _map(day.year, max(rows.values()) + 1, grow=True)
+    for row in rows.values():
+        mapped[row * ROW_BYTES + bit // 8] |= 1 << (bit % 8)
+    mapped.flush()
+
+def remember_question(date, title_slug, day_window):
+    """
+    Keeps the daily question's titleSlug and UTC day window, so a solve made
+    after that day's last check can still be matched to it the next day.
+    """
+    start, end = day_window
+    storage.cache_set(
+        f"daily_question:{date}",
+        {"date": date, "titleSlug": title_slug, "start": start, "end": end},
+        expires_at=end + QUESTION_KEEP_SECONDS,
+    )
+
+def previous_question(date):
+    """The remembered question of the day before `date`, or None."""
+    day = date_cls.fromisoformat(date) - timedelta(days=1)
+    return storage.cache_get(f"daily_question:{day.isoformat()}")
+
+def backfill(all_submissions, question):
+    """
+    Sets the day bit of a remembered `question` for every user whose fetched
+    submissions include it inside its day window. Returns those usernames.
+    """
+    if not question:
+        return []
+    usernames = [
+        username for username, submissions in all_submissions.items()
+        if submissions and any(
+            sub["titleSlug"] == question["titleSlug"] and question["start"] <= int(sub["timestamp"]) < question["end"]
+            for sub in submissions
+        )
+    ]
+    record_solves(usernames, question["date"])
+    return usernames
+
+def _read_row(year, row):
+    mapped = _map(year, row + 1)
+    if mapped is None:
+        return 0
+    return int.from_bytes(mapped[row * ROW_BYTES:(row + 1) * ROW_BYTES], "little")
+
+def _offset(first_year, year):
+    """Bit position of Jan 1 of `year` in a history starting on Jan 1 of first_year."""
+    return sum(_day_bits(y) for y in range(first_year, year))
+
+def _history(row, years, last_year):
+    """A user's whole history as one int, bit 0 being Jan 1 of the oldest year."""
+    bits = 0
+    offset = 0
+    for year in range(years[0], last_year + 1):
+        day_bits = _day_bits(year)
+        if year in years:
+            bits |= (_read_row(year, row) & ((1 << day_bits) - 1)) << offset
+        offset += day_bits
+    return bits
+
+def current_streak(bits, position):
+    """Length of the run of set bits ending at bit `position`."""
+    window = (1 << (position + 1)) - 1
+    gaps = ~bits & window
+    return position + 1 - gaps.bit_length() if gaps else position + 1
+
+def longest_streak(bits):
+    """
+    Length of the longest run of set bits, in O(log n) big-int operations.
+    Bit i of `runs` means a run of `length` set bits starts at bit i; ANDing
+    with itself shifted by s (s <= length) extends that to length + s.
+    """
+    if not bits:
+        return 0
+    runs, length = bits, 1
+    while runs & (runs >> length):
+        runs &= runs >> length
+        length *= 2
+    step = length // 2
+    while step:
+        if runs & (runs >> step):
+            runs &= runs >> step
+            length += step
+        step //= 2
+    return length
+
+def streaks(usernames, date):
+    """
+    Returns {username: (current, longest)} streaks of daily questions solved,
+    as of the question dated `date`. The current streak still counts when
+    only that day is unsolved so far.
+    """
+    usernames = list(usernames)
+    result = {username: (0, 0) for username in usernames}
+    years = _years()
+    if not years:
+        return result
+    day = date_cls.fromisoformat(date)
+    if day.year < years[0]:
+        return result
+    last_year = max(years[-1], day.year)
+    position = _offset(years[0], day.year) + day.timetuple().tm_yday - 1
+
+    for username, row in row_numbers(usernames).items():
+        bits = _history(row, years, last_year)
+        current = current_streak(bits, position)
+        if current == 0 and position > 0:
+            current = current_streak(bits, position - 1)
+        result[username] = (current, longest_streak(bits))
+    return result
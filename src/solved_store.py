@@ -0,0 +1,31 @@
+import time
+from . import storage
+
+# (daily question date, username) -> when the user's accepted submission was made
+storage.register_schema("""
+CREATE TABLE IF NOT EXISTS solved (
+    date TEXT NOT NULL,
+    username TEXT NOT NULL,
+    solved_at REAL NOT NULL,
+    PRIMARY KEY (date, username)
+);
+""")
+
+def solved_usernames(date):
+    """Returns the set of users already confirmed to have solved the question dated `date`."""
+    with storage.connect() as conn:
+        rows = conn.execute("SELECT username FROM solved WHERE date = ?", (date,)).fetchall()
+    return {row[0] for row in rows}
+
+def mark_solved(date, username, solved_at=None):
+    """Records that `username` solved the question dated `date`."""
+    with storage.connect() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO solved (date, username, solved_at) VALUES (?, ?, ?)",
+            (date, username, solved_at if solved_at is not None else time.time())
+        )
+
+def prune(current_date):
+    """Forgets solved state for every question older than `current_date`."""
+    with storage.connect() as conn:
+        conn.execute("DELETE FROM solved WHERE date < ?", (current_date,))
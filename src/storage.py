@@ -0,0 +1,77 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from . import config
+from .log_sink import get_sink
+
+# Table definitions registered by the modules that own them, applied on first connect
+_schemas = []
+_applied = {}
+_schema_lock = threading.Lock()
+
+def register_schema(ddl):
+    """Registers CREATE TABLE/INDEX statements to run against the state database."""
+    with _schema_lock:
+        _schemas.append(ddl)
+
+register_schema("""
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+""")
+
+def _ensure_schema(conn, path):
+    with _schema_lock:
+        done = _applied.get(path, 0)
+        for ddl in _schemas[done:]:
+            conn.executescript(ddl)
+        _applied[path] = len(_schemas)
+
+@contextmanager
+def connect():
+    """
+    Opens a connection to the bot's sqlite state database (config.STATE_DB_PATH).
+    The transaction is committed when the block exits without an error.
+    """
+    path = config.STATE_DB_PATH
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        _ensure_schema(conn, path)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def cache_get(key):
+    """Returns the cached value for key, or None if it is missing or expired."""
+    try:
+        with connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+    except (sqlite3.Error, OSError, ValueError) as e:
+        get_sink().error(f"\n Error reading cache entry {key}: {e}")
+        return None
+
+def cache_set(key, value, expires_at):
+    """Stores a JSON-serialisable value until the epoch time expires_at, dropping expired entries."""
+    try:
+        with connect() as conn:
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at)
+            )
+    except (sqlite3.Error, OSError, TypeError) as e:
+        get_sink().error(f"\n Error writing cache entry {key}: {e}")
@@ -0,0 +1,81 @@
+from datetime import datetime, timezone
+from . import config
+from . import leetcode_api
+from . import storage
+
+# Newest submission timestamp already evaluated for each user
+storage.register_schema("""
+CREATE TABLE IF NOT EXISTS submission_marks (
+    username TEXT PRIMARY KEY,
+    last_seen INTEGER NOT NULL
+);
+""")
+
+def question_day_window(date):
+    """
+    Returns the [start, end) epoch seconds of the daily question dated `date`
+    ("YYYY-MM-DD"): LeetCode's UTC day, 00:00 to 24:00, whatever the time
+    zone of the user or of the run checking it.
+    """
+    day = datetime.strptime(date, "%Y-%m-%d")
+    start = int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+    return start, start + 24 * 60 * 60
+
+def load_marks(usernames):
+    """Returns {username: last seen submission timestamp} for the users that have one."""
+    usernames = list(usernames)
+    marks = {}
+    with storage.connect() as conn:
+        # Stay well below sqlite's bound-parameter limit
+        for i in range(0, len(usernames), 500):
+            chunk = usernames[i:i + 500]
+            rows = conn.execute(
+                f"SELECT username, last_seen FROM submission_marks WHERE username IN ({','.join('?' * len(chunk))})",
+                chunk
+            ).fetchall()
+            marks.update(rows)
+    return marks
+
+def record_seen(submissions_by_user):
+    """Moves each user's high-water mark up to the newest submission that was evaluated."""
+    rows = [
+        (username, max(int(sub["timestamp"]) for sub in submissions))
+        for username, submissions in submissions_by_user.items() if submissions
+    ]
+    if not rows:
+        return
+    with storage.connect() as conn:
+        conn.executemany(
+            "INSERT INTO submission_marks (username, last_seen) VALUES (?, ?) "
+            "ON CONFLICT(username) DO UPDATE SET last_seen = MAX(last_seen, excluded.last_seen)",
+            rows
+        )
+
+def _needs_more(submissions, limit, floor):
+    """True when a full page came back and every entry is newer than `floor`."""
+    # None means the fetch failed; widening would only retry it under more load
+    return submissions is not None and len(submissions) >= limit and all(int(sub["timestamp"]) > floor for sub in submissions)
+
+def sync_submissions(usernames, day_start, max_concurrency=None):
+    """
+    Fetches just enough recent submissions per user to decide today's result.
+    Every user starts at LEETCODE_SUBMISSION_LIMIT; the limit is widened only
+    for users whose whole page is newer than both their high-water mark and
+    `day_start`, since anything older was already evaluated or cannot count.
+    Users whose submissions could not be fetched map to None (unknown).
+    Call record_seen with the result once it has been evaluated.
+    """
+    usernames = list(dict.fromkeys(usernames))
+    marks = load_marks(usernames)
+    floors = {username: max(marks.get(username, 0), day_start - 1) for username in usernames}
+
+    limit = min(max(1, config.LEETCODE_SUBMISSION_LIMIT), leetcode_api.MAX_SUBMISSION_LIMIT)
+    results = leetcode_api.get_recent_submissions_many(usernames, max_concurrency=max_concurrency, limit=limit)
+
+    pending = [u for u in usernames if _needs_more(results[u], limit, floors[u])]
+    while pending and limit < leetcode_api.MAX_SUBMISSION_LIMIT:
+        limit = min(limit * 2, leetcode_api.MAX_SUBMISSION_LIMIT)
+        results.update(leetcode_api.get_recent_submissions_many(pending, max_concurrency=max_concurrency, limit=limit))
+        pending = [u for u in pending if _needs_more(results[u], limit, floors[u])]
+
+    return results
@@ -0,0 +1,254 @@
+import os
+import json
+import threading
+from . import config
+from . import storage
+from .log_sink import get_sink
+
+# Index of the users file, rebuilt only when the file changes
+storage.register_schema("""
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    emails TEXT NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_position ON users (position);
+CREATE TABLE IF NOT EXISTS user_sources (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+""")
+
+# Rows written per INSERT batch while indexing, and read per page while iterating
+BATCH_SIZE = 1000
+
+
+def resolve_users_path():
+    """Returns the users file: USERS_FILE, ./users.json, or users.json next to the sources."""
+    if config.USERS_FILE:
+        return config.USERS_FILE
+    users_filepath = 'users.json' # place users.json in the root
+    if not os.path.exists(users_filepath):
+        # local testing
+        users_filepath = os.path.join(os.path.dirname(__file__), '..', 'users.json')
+    return users_filepath
+
+def _read_records(path):
+    """Yields the raw user records of a JSON array file or, for .jsonl, one record per line."""
+    with open(path, 'r') as f:
+        if path.endswith('.jsonl'):
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    get_sink().error(f" Error: line {line_number} of {path} is not valid JSON, skipping it.")
+        else:
+            records = json.load(f)
+            if not isinstance(records, list):
+                raise ValueError("expected a JSON array of users")
+            yield from records
+
+def _emails_of(record):
+    emails = record.get("emails") or []
+    if isinstance(emails, str):
+        emails = [emails]
+    if record.get("email"):
+        emails = [record["email"]] + list(emails)
+    return [e.strip() for e in emails if isinstance(e, str) and e.strip()]
+
+
+def _to_user(emails, record):
+    user = json.loads(record)
+    user["emails"] = json.loads(emails)
+    user["email"] = user["emails"][0] if user["emails"] else None
+    return user
+
+
+class UserStore:
+    """
+    Users from users.json (a JSON array) or a .jsonl file, indexed in the state
+    database. Usernames are deduplicated, with the emails of every duplicate
+    merged; the file is only re-parsed when its mtime or size changes.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or resolve_users_path()
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Re-indexes the users file if it changed since it was last indexed."""
+        path = os.path.abspath(self.path)
+        with self._lock:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # Nobody is left to check, rather than whoever the last file listed
+                with storage.connect() as conn:
+                    was_indexed = conn.execute("DELETE FROM user_sources").rowcount
+                    conn.execute("DELETE FROM users")
+                if was_indexed:
+                    get_sink().error(f" users.json file not found at {self.path}; no users will be checked until it is back.")
+                return False
+
+            with storage.connect() as conn:
+                row = conn.execute("SELECT mtime_ns, size FROM user_sources WHERE path = ?", (path,)).fetchone()
+            if row == (stat.st_mtime_ns, stat.st_size):
+                return True
+
+            try:
+                self._rebuild(path, stat)
+            except ValueError as e:
+                # A half-edited file keeps the previous index instead of dropping everyone
+                get_sink().error(f" Error: {self.path} is not a valid users file ({e}), keeping the previous users.")
+                return False
+            return True
+
+    def _rebuild(self, path, stat):
+        positions = {}
+        with storage.connect() as conn:
+            conn.execute("DELETE FROM users")
+            conn.execute("DELETE FROM user_sources")
+            batch = []
+            for number, record in enumerate(_read_records(path), 1):
+                if not isinstance(record, dict):
+                    get_sink().error(f" Invalid user record #{number} in {self.path} ({record!r:.80}), skipping it.")
+                    continue
+                username = str(record.get("username") or "").strip()
+                if not username:
+                    get_sink().error(f" User record #{number} in {self.path} has no username, skipping it.")
+                    continue
+                if username in positions:
+                    self._flush(conn, batch)
+                    batch = []
+                    self._merge_duplicate(conn, username, record)
+                    continue
+                positions[username] = len(positions)
+                batch.append((username, positions[username], json.dumps(_emails_of(record)), json.dumps(record)))
+                if len(batch) >= BATCH_SIZE:
+                    self._flush(conn, batch)
+                    batch = []
+            self._flush(conn, batch)
+            conn.execute(
+                "INSERT INTO user_sources (path, mtime_ns, size) VALUES (?, ?, ?)",
+                (path, stat.st_mtime_ns, stat.st_size)
+            )
+        get_sink().info(f"Indexed {len(positions)} users from {self.path}.")
+
+    @staticmethod
+    def _flush(conn, batch):
+        if batch:
+            conn.executemany("INSERT INTO users (username, position, emails, record) VALUES (?, ?, ?, ?)", batch)
+
+    @staticmethod
+    def _merge_duplicate(conn, username, record):
+        (emails,) = conn.execute("SELECT emails FROM users WHERE username = ?", (username,)).fetchone()
+        merged = list(dict.fromkeys(json.loads(emails) + _emails_of(record)))
+        conn.execute("UPDATE users SET emails = ? WHERE username = ?", (json.dumps(merged), username))
+
+    def count(self):
+        """Returns the number of distinct users."""
+        self.refresh()
+        with storage.connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def iter_users(self):
+        """
+        Lazily yields user dicts in file order, one page at a time.
+        Each has the original fields plus `emails` (all addresses) and
+        `email` (the first one).
+        """
+        self.refresh()
+        last_position = -1
+        while True:
+            with storage.connect() as conn:
+                rows = conn.execute(
+                    "SELECT position, emails, record FROM users WHERE position > ? ORDER BY position LIMIT ?",
+                    (last_position, BATCH_SIZE)
+                ).fetchall()
+            if not rows:
+                return
+            for position, emails, record in rows:
+                yield _to_user(emails, record)
+            last_position = rows[-1][0]
+
+    def count_named(self, usernames):
+        """Returns how many of `usernames` are still in the file."""
+        usernames = list(usernames)
+        count = 0
+        with storage.connect() as conn:
+            # Stay well below sqlite's bound-parameter limit
+            for i in range(0, len(usernames), BATCH_SIZE):
+                chunk = usernames[i:i + BATCH_SIZE]
+                count += conn.execute(
+                    f"SELECT COUNT(*) FROM users WHERE username IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchone()[0]
+        return count
+
+    def iter_named(self, usernames):
+        """
+        Lazily yields the user dicts for `usernames` that are still in the
+        file, BATCH_SIZE names per query, in file order within each page.
+        """
+        self.refresh()
+        usernames = list(usernames)
+        # Pages also stay well below sqlite's bound-parameter limit
+        for i in range(0, len(usernames), BATCH_SIZE):
+            chunk = usernames[i:i + BATCH_SIZE]
+            with storage.connect() as conn:
+                rows = conn.execute(
+                    f"SELECT position, emails, record FROM users WHERE username IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+            for _, emails, record in sorted(rows):
+                yield _to_user(emails, record)
+
+    def select(self, usernames, send_at=None):
+        """The users named in `usernames`, as a UserSelection."""
+        return UserSelection(self, usernames, send_at)
+
+    def signature(self):
+        """Changes whenever the users file is re-indexed."""
+        self.refresh()
+        with storage.connect() as conn:
+            return conn.execute(
+                "SELECT mtime_ns, size FROM user_sources WHERE path = ?", (os.path.abspath(self.path),)
+            ).fetchone()
+
+
+class UserSelection:
+    """
+    Some of the store's users by name. Only the names are held: each
+    iteration reads the user dicts from the store a page at a time, so it
+    can be iterated more than once without keeping them all in memory.
+    `send_at` ({username: epoch}) adds "send_at" to the users it names: when
+    their messages should go out.
+    """
+
+    def __init__(self, store, usernames, send_at=None):
+        self.store = store
+        self.usernames = list(usernames)
+        self.send_at = send_at or {}
+
+    def __len__(self):
+        return len(self.usernames)
+
+    def __iter__(self):
+        for user in self.store.iter_named(self.usernames):
+            if user["username"] in self.send_at:
+                user["send_at"] = self.send_at[user["username"]]
+            yield user
+
+
+_default_store = None
+
+def default_store():
+    """Returns the process-wide store for the configured users file."""
+    global _default_store
+    if _default_store is None or _default_store.path != resolve_users_path():
+        _default_store = UserStore()
+    return _default_store